@@ -1,19 +1,43 @@
+from typing import TYPE_CHECKING, Iterable
+import hashlib
+import inspect
 import math
 
-import spacy
-
-NLP = None
+if TYPE_CHECKING:
+    from lexicon_cache import LexiconCache
+
+NLP_MODEL = "de_dep_news_trf"
+# pipeline components used neither for part of speech tags nor for annotating the corpus
+UNUSED_COMPONENTS = ['parser', 'ner']
+# components the corpus annotations need but tagging the anglicisms does not
+TAGGING_UNUSED = ['lemmatizer']
+# loaded pipelines, by model name. tagging and annotating share one per model
+PIPELINES = {}
+
+def get_nlp(model: str = NLP_MODEL):
+    if model not in PIPELINES:
+        # imported here so loading a saved lexicon never pulls in spaCy
+        import spacy
+        nlp = spacy.load(model)
+        nlp.select_pipes(disable=[c for c in UNUSED_COMPONENTS if c in nlp.pipe_names])
+        # spaCy's length limit guards the memory of the parser and ner, long transcripts would go past it
+        nlp.max_length = 10_000_000
+        PIPELINES[model] = nlp
+    return PIPELINES[model]
+
+def rules_fingerprint() -> str:
+    # the morphology rules live in Anglicism.__init__, so any edit to it changes this
+    return hashlib.sha1(inspect.getsource(Anglicism.__init__).encode()).hexdigest()
 
 class Anglicism:
 
-    def __init__(self, ang: str, pos: str|None = None) -> None:
+    __slots__ = ('ang', 'pos', 'morphologies')
+
+    def __init__(self, ang: str, pos: str|None = None, model: str = NLP_MODEL) -> None:
 
         self.ang = ang
-        global NLP
         if not pos:
-            if not NLP:
-                NLP = spacy.load("de_dep_news_trf")
-            doc = NLP(ang)
+            doc = get_nlp(model)(ang)
             self.pos = doc[0].pos_
         else:
             self.pos = pos
@@ -72,6 +96,69 @@ class Anglicism:
             self.morphologies.extend(expand_intensifiers(self.ang))
 
 
+    @classmethod
+    def from_parts(cls, ang: str, pos: str, morphologies: list[str]) -> 'Anglicism':
+
+        # rebuild an anglicism whose morphologies were already expanded
+        out = cls.__new__(cls)
+        out.ang = ang
+        out.pos = pos
+        out.morphologies = morphologies
+        return out
+
+
+    @classmethod
+    def from_tagged(cls, tagged: Iterable[tuple[str, str]], cache: 'LexiconCache|None' = None,
+                    model: str = NLP_MODEL) -> list['Anglicism']:
+
+        # model tags the words that come without a part of speech (ex: rows added in edit mode)
+        tagged = list(tagged)
+        known = cache.get_morphologies(tagged) if cache is not None else {}
+
+        out = []
+        expanded = {}
+        for ang, pos in tagged:
+            if (ang, pos) in known:
+                out.append(cls.from_parts(ang, pos, list(known[(ang, pos)])))
+            else:
+                a = cls(ang, pos, model)
+                expanded[(ang, pos)] = a.morphologies
+                out.append(a)
+
+        if cache is not None and expanded:
+            cache.put_morphologies(expanded)
+        return out
+
+
+    @classmethod
+    def from_words(cls, words: Iterable[str], model: str = NLP_MODEL, batch_size: int = 256, n_process: int = 1,
+                   cache: 'LexiconCache|None' = None) -> list['Anglicism']:
+
+        words = list(words)
+        tags = cache.get_pos(words, model) if cache is not None else {}
+
+        # tag the remaining words in batches instead of running the pipeline once per word
+        missing = [word for word in dict.fromkeys(words) if word not in tags]
+        if missing:
+            nlp = get_nlp(model)
+            with nlp.select_pipes(disable=[c for c in TAGGING_UNUSED if c in nlp.pipe_names]):
+                docs = nlp.pipe(missing, batch_size=batch_size, n_process=n_process)
+                new_tags = {word: doc[0].pos_ for word, doc in zip(missing, docs)}
+            if cache is not None:
+                cache.put_pos(new_tags, model)
+            tags.update(new_tags)
+
+        return cls.from_tagged([(word, tags[word]) for word in words], cache, model)
+
+
+    def __setstate__(self, state) -> None:
+        # pickles from before __slots__ hold a plain __dict__
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
     def __repr__(self) -> str:
         return f'{self.ang}: {self.pos}'
 
@@ -0,0 +1,241 @@
+from pathlib import Path
+import csv
+import heapq
+import math
+import os
+
+import numpy as np
+
+from Anglicism import Anglicism
+
+RESULTS_DIR = 'output/results/'
+# videos printed at the end of an analysis
+TOP_RESULTS = 15
+
+class RunningStats():
+    '''
+    Count, mean and variance of a stream of values (Welford's method), without keeping the values.
+    '''
+    def __init__(self) -> None:
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+
+    def variance(self) -> float:
+        # sample variance, nan until there are two values
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+
+class TopK():
+    '''
+    The k items with the largest keys seen so far, in a heap of at most k items.
+    Items with equal keys keep the order they were added in, the same as a stable sort of everything.
+    '''
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.heap: list[tuple[float, int, object]] = []
+        self.added = 0
+
+
+    def add(self, key: float, item) -> None:
+        # the smallest key (and the latest of equal keys) sits on top and is the one pushed out
+        entry = (key, -self.added, item)
+        self.added += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+
+    def items(self) -> list:
+        return [item for _, _, item in sorted(self.heap, key=lambda e: e[:2], reverse=True)]
+
+
+class SpaceSaving():
+    '''
+    Approximate counts of the most frequent keys of a stream (Space-Saving), keeping at most capacity keys.
+    A key that is not kept replaces the one with the lowest count and inherits that count as its error, so a
+    kept key's true count is between count - error and count. Any key with a true count over total / capacity is kept.
+    '''
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.counts: dict = {}
+        self.errors: dict = {}
+        self.total = 0
+        # (count, key) of every kept key, counts only grow so an entry can be behind but never ahead
+        self.heap: list = []
+
+
+    def add(self, key, n: int = 1) -> None:
+        self.total += n
+        if key in self.counts:
+            self.counts[key] += n
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = n
+            self.errors[key] = 0
+            heapq.heappush(self.heap, (n, key))
+            return
+
+        # entries that fell behind are brought up to date until the top one is the real minimum
+        while self.heap[0][0] != self.counts[self.heap[0][1]]:
+            _, stale = self.heap[0]
+            heapq.heapreplace(self.heap, (self.counts[stale], stale))
+        smallest, evicted = self.heap[0]
+        del self.counts[evicted], self.errors[evicted]
+        self.counts[key] = smallest + n
+        self.errors[key] = smallest
+        heapq.heapreplace(self.heap, (smallest + n, key))
+
+
+    def top(self, k: int|None = None) -> list[tuple[object, int, int]]:
+        # (key, count, error), highest count first
+        out = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, count, self.errors[key]) for key, count in out]
+
+
+class Totals():
+    '''
+    Exact totals of one group of videos (an anglicism, a channel or a category).
+    '''
+    def __init__(self) -> None:
+        self.videos = 0
+        self.occurrences = 0
+        self.entropy = RunningStats()
+        # occurrences of close matches (probable misspellings), never part of occurrences
+        self.fuzzy = 0
+
+
+class Aggregator():
+    '''
+    Folds the results of each video into totals per anglicism, channel and category as they come in, so memory
+    depends on the size of the lexicon and the number of channels rather than the number of videos.
+    '''
+    def __init__(self, heavy_hitters: int = 0, fuzzy: bool = False, top: int = TOP_RESULTS) -> None:
+
+        self.anglicisms: dict[str, Totals] = {}
+        self.channels: dict[str, Totals] = {}
+        self.categories: dict[str, Totals] = {}
+        self.videos = 0
+        # the videos with the most hits and with the most entropy windows
+        self.top_found = TopK(top)
+        self.top_entropies = TopK(top)
+        # (anglicism, channel) pairs grow with the corpus, so their counts are only estimated
+        self.pairs = SpaceSaving(heavy_hitters) if heavy_hitters > 0 else None
+        # (anglicism, token, edit distance) -> [occurrences, videos] of the close matches, when they are looked for
+        self.fuzzy = fuzzy
+        self.close: dict[tuple[str, str, int], list[int]] = {}
+
+
+    def add(self, channel: str, category: str|None, title: str|None, found_angs: dict[str, int],
+            entropies: list[tuple[Anglicism, float]], close: dict[tuple[str, str, int], int]|None = None) -> None:
+
+        # close holds the video's close matches, (anglicism, token, edit distance) -> occurrences
+        close = close or {}
+        self.videos += 1
+        occurrences = sum(found_angs.values())
+        fuzzy = sum(close.values())
+        mean = sum(e for _, e in entropies) / len(entropies) if entropies else math.nan
+        self.top_found.add(occurrences, (channel, category, title, found_angs, len(entropies), mean, fuzzy))
+        self.top_entropies.add(len(entropies), entropies)
+
+        groups = [self.channels.setdefault(channel, Totals()),
+                  self.categories.setdefault(category or 'Unknown', Totals())]
+        for totals in groups:
+            totals.videos += 1
+            totals.occurrences += occurrences
+            totals.fuzzy += fuzzy
+        for (ang, token, distance), n in close.items():
+            self.anglicisms.setdefault(ang, Totals()).fuzzy += n
+            total = self.close.setdefault((ang, token, distance), [0, 0])
+            total[0] += n
+            total[1] += 1
+        for ang, n in found_angs.items():
+            totals = self.anglicisms.setdefault(ang, Totals())
+            totals.videos += 1
+            totals.occurrences += n
+            if self.pairs is not None:
+                self.pairs.add((ang, channel), n)
+        for ang, entropy in entropies:
+            self.anglicisms.setdefault(ang.ang, Totals()).entropy.add(entropy)
+            for totals in groups:
+                totals.entropy.add(entropy)
+
+
+    def top_fuzzy(self, k: int|None = None) -> list[tuple[tuple[str, str, int], list[int]]]:
+        # the most frequent close matches, ((anglicism, token, edit distance), [occurrences, videos])
+        return sorted(self.close.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+    def write(self, directory: str = RESULTS_DIR) -> list[Path]:
+
+        # one table per grouping, as a csv file and as a .npz file of numpy columns
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        tables = {'anglicisms': ('anglicism', self.anglicisms), 'channels': ('channel', self.channels),
+                  'categories': ('category', self.categories)}
+        for name, (key, groups) in tables.items():
+            ordered = sorted(groups.items(), key=lambda item: item[1].occurrences, reverse=True)
+            columns = {
+                key: np.asarray([k for k, _ in ordered], dtype=str),
+                'videos': np.asarray([t.videos for _, t in ordered], dtype=np.int64),
+                'occurrences': np.asarray([t.occurrences for _, t in ordered], dtype=np.int64),
+                'windows': np.asarray([t.entropy.n for _, t in ordered], dtype=np.int64),
+                'entropy_mean': np.asarray([t.entropy.mean if t.entropy.n else math.nan for _, t in ordered]),
+                'entropy_variance': np.asarray([t.entropy.variance() for _, t in ordered]),
+            }
+            if self.fuzzy:
+                columns['fuzzy'] = np.asarray([t.fuzzy for _, t in ordered], dtype=np.int64)
+            paths.extend(write_table(Path(directory) / name, columns))
+
+        top_videos = self.top_found.items()
+        columns = {
+            'channel': np.asarray([v[0] for v in top_videos], dtype=str),
+            'category': np.asarray([v[1] or '' for v in top_videos], dtype=str),
+            'title': np.asarray([v[2] or '' for v in top_videos], dtype=str),
+            'occurrences': np.asarray([sum(v[3].values()) for v in top_videos], dtype=np.int64),
+            'windows': np.asarray([v[4] for v in top_videos], dtype=np.int64),
+            'entropy_mean': np.asarray([v[5] for v in top_videos]),
+        }
+        if self.fuzzy:
+            columns['fuzzy'] = np.asarray([v[6] for v in top_videos], dtype=np.int64)
+        paths.extend(write_table(Path(directory) / 'top_videos', columns))
+
+        if self.fuzzy:
+            top = self.top_fuzzy()
+            columns = {
+                'anglicism': np.asarray([ang for (ang, _, _), _ in top], dtype=str),
+                'token': np.asarray([token for (_, token, _), _ in top], dtype=str),
+                'distance': np.asarray([distance for (_, _, distance), _ in top], dtype=np.int64),
+                'occurrences': np.asarray([occurrences for _, (occurrences, _) in top], dtype=np.int64),
+                'videos': np.asarray([videos for _, (_, videos) in top], dtype=np.int64),
+            }
+            paths.extend(write_table(Path(directory) / 'close_matches', columns))
+
+        if self.pairs is not None:
+            top = self.pairs.top()
+            columns = {
+                'anglicism': np.asarray([ang for (ang, _), _, _ in top], dtype=str),
+                'channel': np.asarray([channel for (_, channel), _, _ in top], dtype=str),
+                'occurrences': np.asarray([count for _, count, _ in top], dtype=np.int64),
+                'error': np.asarray([error for _, _, error in top], dtype=np.int64),
+            }
+            paths.extend(write_table(Path(directory) / 'heavy_hitters', columns))
+        return paths
+
+
+def write_table(path: Path, columns: dict[str, np.ndarray]) -> list[Path]:
+    np.savez_compressed(path.with_suffix('.npz'), **columns)
+    with open(path.with_suffix('.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(c.tolist() for c in columns.values())))
+    return [path.with_suffix('.npz'), path.with_suffix('.csv')]
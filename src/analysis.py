@@ -1,79 +1,146 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 import argparse
 import code
 import json
 import os 
-import pandas as pd
 import pickle
-import requests
 import sys
 
-from bs4 import BeautifulSoup
-from pdfminer.high_level import extract_pages
+import numpy as np
+
+from Anglicism import Anglicism, NLP_MODEL
+from aggregate import RESULTS_DIR, Aggregator
+from annotate import ANNOTATION_BATCH_SIZE, annotate_channel, get_lemmas
+from corpus import EncodedChannel, channel_paths, file_hash, get_encoded, iter_channel
+from corpus_store import CorpusStore
+from entropy import encode, window_entropies
+from fuzzy import FuzzyIndex
+from lexicon_cache import LexiconCache
+from lexicon import LEXICON_PATH, Lexicon
+from matcher import Matcher
+from profiling import PROFILER, run_profiled
+from result_cache import ResultCache
+
+# lexicon file written by older versions, converted on first use
+ANGLICISIMS_PKL_PATH = 'output/anglicisms.pkl'
+# words scraped from each version of the anglicism pdf
+PDF_CACHE_DIR = 'output/cache/'
 
-from Anglicism import Anglicism
+def first_occurrences(occurrences: Iterable[tuple[Anglicism, str, int]]) -> Iterator[tuple[Anglicism, str, int]]:
 
-ANGLICISIMS_PKL_PATH = 'output/anglicisms.pkl'
+    # only keep the first hit of each anglicism
+    seen = set()
+    for occurrence in occurrences:
+        if id(occurrence[0]) not in seen:
+            seen.add(id(occurrence[0]))
+            yield occurrence
 
-def find_angilicisms(video: dict, anglicisms: list[Anglicism]):
 
-    ENTROPY_WINDOW_SIZE = 25
-    result = {}
-    entropies = []
+def find_angilicisms(video: dict, matcher: Matcher, all_occurrences: bool = False):
+
     transcript = video['transcript'].split()
+    # token ids for the whole transcript, used to compute every entropy window at once
+    ids, vocab = encode(transcript)
+    return score_occurrences(matcher.iter_occurrences(transcript), ids, vocab, all_occurrences)
+
+
+def find_fuzzy(video: dict, index: FuzzyIndex) -> dict[tuple[str, str, int], int]:
+
+    # the close matches of one video, kept apart from the exact hits of find_angilicisms
+    ids, vocab = encode(video['transcript'].split())
+    return score_fuzzy(ids, list(vocab), fuzzy_matches(vocab, index))
+
+
+def fuzzy_matches(vocab: Iterable[str], index: FuzzyIndex) -> dict[int, list[tuple[Anglicism, str, int]]]:
+    # vocab id -> lookup result, for the ids that are close to an anglicism. shared by every video with that vocab
+    out = {}
+    for i, token in enumerate(vocab):
+        found = index.lookup(token)
+        if found:
+            out[i] = found
+    return out
+
+
+def score_fuzzy(ids: np.ndarray, vocab: list[str],
+                matches: dict[int, list[tuple[Anglicism, str, int]]]) -> dict[tuple[str, str, int], int]:
 
-    found = []
-
-    for ang in anglicisms: 
-        if not isinstance(ang, Anglicism):
-            print(f'{ang} wrong type')
-        # ignore small ones (likely to be garbage)
-        if len(ang.ang) < 3:
-            continue
-
-        # check against each form of the anglicism
-        if ang in transcript:
-            # if its found save the index in the transcript where it was
-            found.append( (ang, transcript.index(ang)) )
-
-    # sort the found list by the indicies
-    found = sorted(found, key=lambda x : x[1])
-    # calculate entropies for all found anglicisms
-    for i, (ang, index) in enumerate(found):
-        # get the anglicism that was found 
+    # (anglicism, token, edit distance) -> occurrences in one video, ids are the video's tokens encoded with vocab
+    if not matches:
+        return {}
+    close = np.fromiter(matches, dtype=np.int64, count=len(matches))
+    found, occurrences = np.unique(ids[np.isin(ids, close)], return_counts=True)
+    out = {}
+    for i, n in zip(found.tolist(), occurrences.tolist()):
+        for ang, _, distance in matches[i]:
+            out[(ang.ang, vocab[i], distance)] = n
+    return out
+
+
+def score_occurrences(found: Iterator[tuple[Anglicism, str, int]], ids: np.ndarray, vocab: dict[str, int],
+                      all_occurrences: bool = False, form_ids: dict[int, list[int]]|None = None):
+
+    # counts and entropy windows for the hits of one video, ids are the video's tokens encoded with vocab.
+    # form_ids caches the ids of each anglicism's forms and can be shared by videos with the same vocab
+    ENTROPY_WINDOW_SIZE = 25
+    result = {}
+    hits = []
+    windows = []
+    excluded = []
+    if form_ids is None:
+        form_ids = {}
+
+    if not all_occurrences:
+        found = first_occurrences(found)
+
+    # hits come out sorted by offset, so each one only needs to see the offset of the next
+    # to close its window. this keeps a single hit in memory instead of the whole list
+    current = next(found, None)
+    while current is not None:
+        ang, _, offset = current
+        following = next(found, None)
         # calculate bounds for entropy window
-        lower = max(0, index-ENTROPY_WINDOW_SIZE)
-        upper = min(len(transcript), index+ENTROPY_WINDOW_SIZE)
+        lower = max(0, offset-ENTROPY_WINDOW_SIZE)
+        upper = min(len(ids), offset+ENTROPY_WINDOW_SIZE)
 
         # this will ensure no overlap in windows
         # ex: [blah blah blah ang1 blah blah][ang2 blah blah blah][ang3 blah blah] 
-        if (i < len(found)-1 and found[i+1][1] < upper):
-            upper = found[i+1][1]
-
-        # calculate
-        entropies.append( (ang, ang.calc_entropy(transcript[lower:upper])) )
+        if (following is not None and following[2] < upper):
+            upper = following[2]
+
+        # the anglicism's own forms are left out of its window, as in Anglicism.calc_entropy
+        if id(ang) not in form_ids:
+            form_ids[id(ang)] = [vocab[f] for f in ang.morphologies if f in vocab]
+        windows.append( (lower, upper) )
+        excluded.append(form_ids[id(ang)])
+        hits.append(ang)
         if ang.ang in result.keys():
             result[ang.ang] += 1 
         else:
             result[ang.ang] = 1
-            
-    return result, entropies
 
+        current = following
+
+    # calculate
+    entropies = list(zip(hits, window_entropies(ids, windows, excluded, len(vocab))))
+    return result, entropies
 
-def tagging():
 
-    nlp = spacy.load("de_dep_news_trf")
-    for p in Path("output/").glob("*.json"):
-        channel = json.loads(p.read_text())
-        transcripts = [v['transcript'] for v in channel['transcripts']]
-        for transcript in transcripts[:1]:
-            doc = nlp(transcript)
-            for token in doc:
-                print(f'{token.text}: {token.pos_} {token.pos}')
+def annotate(model: str = NLP_MODEL, batch_size: int = ANNOTATION_BATCH_SIZE, n_process: int = 1):
+    # tags and lemmatizes the whole corpus, only videos that are new or changed since the last run are annotated
+    for p in channel_paths():
+        meta = annotate_channel(p, model, batch_size, n_process)
+        print(f'{p.stem}: {sum(len(shard) for shard in meta["shards"])} videos annotated.')
 
 
 def scrape_website(url: str) -> set[str]:
 
+    # scraping libraries are only imported when the anglicism list has to be built
+    import requests
+    from bs4 import BeautifulSoup
+
     print(f'Scraping website: {url}')
 
     out = set()
@@ -92,18 +159,13 @@ def scrape_website(url: str) -> set[str]:
     print(f'{len(out)} anglicisms scraped.')
     return out 
 
-def scrape_pdf(path: str)  -> set[str]:
+def scrape_pdf_pages(path: str, pages: list[int]) -> set[str]:
 
-    print(f'Scraping pdf: {path}')
+    from pdfminer.high_level import extract_pages
 
-    pdf = extract_pages(path)
     anglicisms = set()
 
-    for i, page in enumerate(pdf):
-        # page number 14 is horribly formatted, page number 425 is blank.
-        if i == 13 or i == 424:
-            continue
-
+    for page in extract_pages(path, page_numbers=pages):
         # main text box is second to last on each page, always followed by textbox containing page number
         box = list(page)[-2]
         for line in box:
@@ -132,11 +194,47 @@ def scrape_pdf(path: str)  -> set[str]:
                         # next line 
                         break
 
+    return anglicisms
+
+
+def scrape_pdf(path: str, workers: int|None = None)  -> set[str]:
+
+    # the words only depend on the pdf, so they are cached under a hash of its contents
+    cache_path = os.path.join(PDF_CACHE_DIR, f'pdf-{file_hash(Path(path))}.json')
+    if os.path.exists(cache_path):
+        print(f'Using cached anglicisms of pdf: {path}')
+        with open(cache_path, 'r') as f:
+            return set(json.load(f))
+
+    from pdfminer.pdfpage import PDFPage
+
+    print(f'Scraping pdf: {path}')
+
+    with open(path, 'rb') as f:
+        page_count = sum(1 for _ in PDFPage.get_pages(f))
+    # page number 14 is horribly formatted, page number 425 is blank.
+    pages = [i for i in range(page_count) if i not in (13, 424)]
+
+    # pages are split into more ranges than processes so a slow range does not hold up the rest
+    workers = workers or os.cpu_count() or 1
+    size = max(1, -(-len(pages) // (workers * 4)))
+    ranges = [pages[i:i+size] for i in range(0, len(pages), size)]
+
+    anglicisms = set()
+    with ProcessPoolExecutor(workers) as pool:
+        for found in pool.map(scrape_pdf_pages, [path] * len(ranges), ranges):
+            anglicisms.update(found)
+
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    with open(cache_path + '.tmp', 'w') as f:
+        json.dump(sorted(anglicisms), f, ensure_ascii=False)
+    os.replace(cache_path + '.tmp', cache_path)
+
     print(f'{len(anglicisms)} anglicisms scraped.')
     return anglicisms
 
 
-def get_anglicisms() -> list[Anglicism]:
+def get_anglicisms(model: str = NLP_MODEL, batch_size: int = 256, n_process: int = 1) -> Lexicon:
 
     # anglicisms are stored as a dictionary containing the anglicism and its part of speech
     ANGLICISIMS_PDF_PATH = 'input/anglicisms.pdf'
@@ -146,66 +244,267 @@ def get_anglicisms() -> list[Anglicism]:
     if not os.path.exists('output/'):
         os.mkdir('output')
 
-    anglicisms: list[Anglicism] = []
-    if os.path.exists(ANGLICISIMS_PKL_PATH):
+    if os.path.exists(LEXICON_PATH):
+        print(f'Using existing {LEXICON_PATH} file')
+        anglicisms = Lexicon.load(LEXICON_PATH)
+    elif os.path.exists(ANGLICISIMS_PKL_PATH):
+        # lists pickled by older versions are converted once, the pickle is left untouched
         with open(ANGLICISIMS_PKL_PATH, 'rb') as f:
-            print('Using existing anglicisms.pkl file')
-            anglicisms = pickle.load(f)
+            print(f'Converting existing anglicisms.pkl file to {LEXICON_PATH}')
+            anglicisms = Lexicon.from_anglicisms(pickle.load(f))
+        anglicisms.save(LEXICON_PATH)
     else:
-        print('anglicisms.pkl not found, scraping...')
+        print('anglicisms not found, scraping...')
         # get anglicisms from the pdf
         pdf_anglicisms = scrape_pdf(ANGLICISIMS_PDF_PATH)
         # get anglicisms from the website
         website_anglicisms = scrape_website(ANGLICISIMS_WEBSITE_URL)
         # merge the two sets (union ensures no repeats) and sort
         scraped_angs = sorted(website_anglicisms.union(pdf_anglicisms))
-        for ang in scraped_angs:
-            anglicisms.append(Anglicism(ang))
+        # part of speech tag all of them in batches
+        cache = LexiconCache()
+        anglicisms = Lexicon.from_anglicisms(Anglicism.from_words(scraped_angs, model, batch_size, n_process, cache))
+        cache.close()
 
         print(f'{len(anglicisms)} unique anglicisms scraped.')
 
-        with open(ANGLICISIMS_PKL_PATH, 'wb') as f:
-            pickle.dump(anglicisms, f)
-        print(f'Anglicisms written to file: {ANGLICISIMS_PKL_PATH}.')
+        anglicisms.save(LEXICON_PATH)
+        print(f'Anglicisms written to file: {LEXICON_PATH}.')
 
     return anglicisms
 
 def get_transcripts():
+    # loads the whole corpus at once, prefer corpus.iter_videos when going through every video
     channels = []
-    for p in Path("output/").glob("*.json"):
-        channel = json.loads(p.read_text())
-        channels.append(channel)
+    for p in channel_paths():
+        channels.append({'id': p.stem, 'transcripts': list(iter_channel(p))})
 
     return channels
 
-def analyze():
-    all_anglicisms = []
-    all_entropies = []
-
-    angs = get_anglicisms()
-    transcripts = get_transcripts()
-    for channel in transcripts:
-        videos = channel['transcripts']
-        for v in videos:
-            found_angs, entropies = find_angilicisms(v, angs)
-            all_anglicisms.append(found_angs)
-            all_entropies.append(entropies)
-
-    top15_angs = sorted(all_anglicisms, key=lambda x: sum(x.values()), reverse=True)[:15]
-    top15_ents = sorted(all_entropies, key=len, reverse=True)[:15]
-    for a, e in zip(top15_angs, top15_ents):
+# state of each analyze worker process, set once by init_worker instead of being sent with every task
+WORKER_MATCHER: Matcher|None = None
+WORKER_POSITIONS: dict[int, int] = {}
+# (directory, encoded channel, vocab, matcher reading its ids, form id cache) of the last channel a worker saw
+WORKER_CHANNEL: tuple[Path, EncodedChannel, dict[str, int], Matcher, dict[int, list[int]]]|None = None
+
+def init_worker(lexicon: Lexicon, profile: bool = False):
+    global WORKER_MATCHER, WORKER_POSITIONS, WORKER_CHANNEL
+    PROFILER.enabled = profile
+    WORKER_MATCHER = Matcher(lexicon)
+    WORKER_POSITIONS = {id(a): i for i, a in enumerate(lexicon)}
+    WORKER_CHANNEL = None
+
+
+def load_channel(directory: Path):
+
+    # chunks arrive roughly in channel order, so only the latest channel is kept open
+    global WORKER_CHANNEL
+    assert WORKER_MATCHER is not None
+    if WORKER_CHANNEL is None or WORKER_CHANNEL[0] != directory:
+        with PROFILER.stage('channel_load'):
+            channel = EncodedChannel(directory)
+            vocab = {token: i for i, token in enumerate(channel.vocab)}
+            WORKER_CHANNEL = (directory, channel, vocab, WORKER_MATCHER.with_vocab(vocab), {})
+    return WORKER_CHANNEL
+
+
+def analyze_chunk(directory: Path, videos: list[int], all_occurrences: bool) -> tuple[list[tuple[dict, list[tuple[int, float]]]], dict]:
+
+    # also returns what the profiler recorded for the chunk, empty unless profiling
+    _, channel, vocab, matcher, form_ids = load_channel(directory)
+    out = []
+    for i in videos:
+        # matching and entropy both work straight off the memory mapped token ids
+        ids = channel.video(i)
+        found = matcher.iter_encoded(ids)
+        if PROFILER.enabled:
+            # hits are collected up front so matching and entropy are timed apart
+            with PROFILER.stage('matching'):
+                found = list(found)
+            PROFILER.count('videos')
+            PROFILER.count('tokens', len(ids))
+            PROFILER.count('hits', len(found))
+            # tokens the automaton has to look up, the rest are in no form and skipped
+            PROFILER.count('comparisons', int(matcher.known[ids].sum()))
+            found = iter(found)
+
+        with PROFILER.stage('entropy'):
+            found_angs, entropies = score_occurrences(found, ids, vocab, all_occurrences, form_ids)
+        PROFILER.count('windows', len(entropies))
+        # send back lexicon positions rather than pickling the anglicisms themselves
+        out.append((found_angs, [(WORKER_POSITIONS[id(a)], e) for a, e in entropies]))
+    return out, PROFILER.take()
+
+
+def iter_results(paths: Iterable[Path], angs: Lexicon, all_occurrences: bool = False, workers: int = 1,
+                 chunk_size: int = 64, cache: ResultCache|None = None,
+                 encoder: Callable[[Path], EncodedChannel] = get_encoded) -> Iterator[tuple[EncodedChannel, int, dict, list]]:
+
+    # (channel, video position, counts, entropies) of every video.
+    # every channel is encoded to token ids (or loaded from the encoded cache) right before its videos are needed.
+    # encoder gives the tokens to match against, the transcript tokens by default.
+    # each chunk of videos is split into results found in the cache and a task for the rest
+    def chunks() -> Iterator[tuple[tuple[Path, list[int]], list, tuple[EncodedChannel, int]]]:
+        for path in paths:
+            channel = encoder(path)
+            for start in range(0, len(channel), chunk_size):
+                stop = min(start + chunk_size, len(channel))
+                if cache is not None:
+                    with PROFILER.stage('cache_lookup'):
+                        cached = cache.lookup(channel, start, stop, all_occurrences)
+                else:
+                    cached = [None] * (stop - start)
+                todo = [i for i, c in zip(range(start, stop), cached) if c is None]
+                yield (channel.directory, todo), cached, (channel, start)
+
+    def merge(chunk: tuple[list, dict], cached: list, where: tuple[EncodedChannel, int]) -> Iterator[tuple[EncodedChannel, int, dict, list]]:
+        results, stats = chunk
+        PROFILER.merge(stats)
+        computed = merge_chunk(results, angs)
+        channel, start = where
+        for i, c in enumerate(cached, start):
+            if c is None:
+                c = next(computed)
+                if cache is not None:
+                    with PROFILER.stage('cache_store'):
+                        cache.put(channel.hashes[i], all_occurrences, *c)
+            yield channel, i, *c
+
+    def wait(future) -> tuple[list, dict]:
+        # includes unpickling the results sent back by the worker
+        with PROFILER.stage('wait'):
+            return future.result() if future else ([], {})
+
+    # results come out in the same order as the videos, whatever the number of workers
+    if workers <= 1:
+        init_worker(angs, PROFILER.enabled)
+        for task, cached, where in chunks():
+            yield from merge(analyze_chunk(*task, all_occurrences), cached, where)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(angs, PROFILER.enabled)) as pool:
+        # only a few chunks per worker are in flight at once so memory does not grow with the corpus
+        pending = deque()
+        for task, cached, where in chunks():
+            future = pool.submit(analyze_chunk, *task, all_occurrences) if task[1] else None
+            pending.append((future, cached, where))
+            if len(pending) >= workers * 2:
+                future, cached, where = pending.popleft()
+                yield from merge(wait(future), cached, where)
+        while pending:
+            future, cached, where = pending.popleft()
+            yield from merge(wait(future), cached, where)
+
+
+def merge_chunk(results: list[tuple[dict, list[tuple[int, float]]]], angs: Lexicon) -> Iterator[tuple[dict, list]]:
+    for found_angs, entropies in results:
+        yield found_angs, [(angs[i], e) for i, e in entropies]
+
+
+def analyze(all_occurrences: bool = False, model: str = NLP_MODEL, batch_size: int = 256, n_process: int = 1,
+            workers: int = 1, use_cache: bool = True, lemmas: bool = False,
+            annotation_batch_size: int = ANNOTATION_BATCH_SIZE, fuzzy: bool = False, heavy_hitters: int = 0,
+            results_dir: str = RESULTS_DIR):
+
+    # results are folded into totals as they come in instead of being kept per video
+    totals = Aggregator(heavy_hitters, fuzzy)
+
+    with PROFILER.stage('lexicon'):
+        angs = get_anglicisms(model, batch_size, n_process)
+    index = None
+    if fuzzy:
+        # tokens that are probably misspelled anglicisms, reported next to the exact hits but never counted as them
+        with PROFILER.stage('fuzzy_index'):
+            index = FuzzyIndex(angs)
+    # vocab id -> close matches, for the channel being read
+    matches: tuple[Path, dict]|None = None
+    cache = ResultCache(angs) if use_cache else None
+    # anglicisms are matched against the transcript tokens, or against their lemmas from the cached annotations
+    encoder = get_encoded
+    if lemmas:
+        encoder = lambda p: get_lemmas(p, model, annotation_batch_size, n_process)
+    for channel, i, found_angs, entropies in iter_results(channel_paths(), angs, all_occurrences, workers, cache=cache,
+                                                          encoder=encoder):
+        close = None
+        if index is not None:
+            with PROFILER.stage('fuzzy'):
+                # each distinct token of a channel is looked up once
+                if matches is None or matches[0] != channel.directory:
+                    matches = (channel.directory, fuzzy_matches(channel.vocab, index))
+                close = score_fuzzy(channel.video(i), channel.vocab, matches[1])
+        with PROFILER.stage('aggregate'):
+            totals.add(channel.directory.stem, channel.categories[i], channel.titles[i], found_angs, entropies, close)
+    if cache is not None:
+        cache.close()
+        PROFILER.count('cache_hits', cache.hits)
+        PROFILER.count('cache_misses', cache.misses)
+
+    for (_, _, _, a, _, _, _), e in zip(totals.top_found.items(), totals.top_entropies.items()):
         print("\n\nresult:")
         print(a)
         print(e)
+    with PROFILER.stage('write_results'):
+        totals.write(results_dir)
+    PROFILER.count('aggregated_videos', totals.videos)
+    print(f'\n\nTotals of {totals.videos} videos written to: {results_dir}')
+
+    if fuzzy:
+        print("\n\nclose matches:")
+        for (ang, token, distance), (occurrences, videos) in totals.top_fuzzy(15):
+            print(f'{token} -> {ang} (distance {distance}): {occurrences} occurrences in {videos} videos')
+
+    if cache is not None:
+        print(cache.report())
+
+def ingest():
+    store = CorpusStore()
+    updated, removed = store.ingest(channel_paths())
+    store.close()
+    print(f'{updated} channels ingested, {removed} removed.')
 
-def edit():
-    angs = get_anglicisms()
-    df = pd.DataFrame([vars(a) for a in angs])
+
+def query(words: list[str], category: str|None = None, channel: str|None = None, limit: int = 20):
+
+    # words found in the anglicism list are looked up with all of their forms, other words as given
+    lexicon = Lexicon.load(LEXICON_PATH) if os.path.exists(LEXICON_PATH) else None
+    store = CorpusStore()
+
+    if not words:
+        # no words: how often each anglicism is used
+        if lexicon is None:
+            print(f'{LEXICON_PATH} not found, run analyze first or give words to look up.')
+        else:
+            counts = store.counts(lexicon, category, channel)
+            for ang, (occurrences, videos) in sorted(counts.items(), key=lambda x: x[1], reverse=True)[:limit]:
+                print(f'{ang}: {occurrences} occurrences in {videos} videos')
+
+    for word in words:
+        forms = {word}
+        if lexicon is not None:
+            for i in range(len(lexicon)):
+                if lexicon.angs[i] == word:
+                    forms.update(lexicon.morphologies(i))
+
+        hits = store.query(forms, category, channel, limit)
+        print(f'\n{word}: {sum(h["count"] for h in hits)} occurrences in the top {len(hits)} videos')
+        for h in hits:
+            print(f'  {h["count"]:>4}  {h["channel"]} | {h["category"]} | {h["title"]}')
+            print(f'        {h["snippet"]}')
+    store.close()
+
+
+def edit(model: str = NLP_MODEL, batch_size: int = 256, n_process: int = 1):
+    import pandas as pd
+
+    angs = get_anglicisms(model, batch_size, n_process)
+    df = pd.DataFrame([{'ang': a.ang, 'pos': a.pos, 'morphologies': a.morphologies} for a in angs])
     def save_and_exit():
         print('Saving changes made to anglicisms')
-        angs_out = [Anglicism(ang, pos) for (ang, pos) in zip(df['ang'], df['pos'])]
-        with open(ANGLICISIMS_PKL_PATH, 'wb') as f:
-            pickle.dump(angs_out, f)
+        # only words that were added or changed need their morphologies expanded
+        cache = LexiconCache()
+        angs_out = Lexicon.from_anglicisms(Anglicism.from_tagged(zip(df['ang'], df['pos']), cache, model))
+        cache.close()
+        angs_out.save(LEXICON_PATH)
         sys.exit(0)
 
     l = globals().copy()
@@ -223,12 +522,60 @@ def edit():
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(prog='Corpus Analysis')
-    parser.add_argument("command", choices=["analyze", "explore"], 
-                        help="The command to execute (either 'analyze' or 'edit').")
+    parser.add_argument("command", choices=["analyze", "edit", "annotate", "ingest", "query"], 
+                        help="The command to execute ('analyze', 'edit', 'annotate', 'ingest' or 'query').")
+    parser.add_argument("words", nargs="*",
+                        help="words to look up with the query command.")
+    parser.add_argument("--all-occurrences", action="store_true",
+                        help="count every occurrence of an anglicism instead of only the first one in each video.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes used to analyze videos.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="analyze every video again instead of reusing results from earlier runs.")
+    parser.add_argument("--model", default=NLP_MODEL,
+                        help="spaCy pipeline used to tag parts of speech when building the anglicism list and annotating the corpus.")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="number of anglicisms tagged per batch when building the anglicism list.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes used to tag anglicisms when building the anglicism list, and to annotate the corpus.")
+    parser.add_argument("--fuzzy", action="store_true",
+                        help="also list tokens that are one or two typos away from an anglicism (ex: caption misspellings).")
+    parser.add_argument("--heavy-hitters", type=int, default=0,
+                        help="also estimate the most frequent (anglicism, channel) pairs, keeping at most this many pairs.")
+    parser.add_argument("--results-dir", default=RESULTS_DIR,
+                        help="directory the per anglicism, channel and category totals of analyze are written to.")
+    parser.add_argument("--lemmas", action="store_true",
+                        help="match anglicisms against the lemmas of the annotated transcripts (see annotate).")
+    parser.add_argument("--annotation-batch-size", type=int, default=ANNOTATION_BATCH_SIZE,
+                        help="number of transcripts tagged per batch when annotating the corpus.")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each stage of analyze and write a json report to output/profile/.")
+    parser.add_argument("--profile-python", action="store_true",
+                        help="also run cProfile and add the slowest functions to the profile report.")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also trace memory allocations with tracemalloc and add them to the profile report.")
+    parser.add_argument("--category",
+                        help="only look up videos of this category with the query command.")
+    parser.add_argument("--channel",
+                        help="only look up videos of this channel with the query command.")
+    parser.add_argument("--limit", type=int, default=20,
+                        help="number of videos (or anglicisms) listed by the query command.")
 
     args = parser.parse_args()
 
     if args.command == 'analyze':
-        analyze()
+        run = lambda: analyze(args.all_occurrences, args.model, args.batch_size, args.processes, args.workers,
+                              not args.no_cache, args.lemmas, args.annotation_batch_size, args.fuzzy,
+                              args.heavy_hitters, args.results_dir)
+        if args.profile or args.profile_python or args.profile_memory:
+            run_profiled('analyze', run, args.profile_python, args.profile_memory)
+        else:
+            run()
     elif args.command == 'edit':
-        edit()
+        edit(args.model, args.batch_size, args.processes)
+    elif args.command == 'annotate':
+        annotate(args.model, args.annotation_batch_size, args.processes)
+    elif args.command == 'ingest':
+        ingest()
+    elif args.command == 'query':
+        query(args.words, args.category, args.channel, args.limit)
@@ -0,0 +1,148 @@
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+import hashlib
+import json
+import os
+import shutil
+
+from Anglicism import NLP_MODEL, UNUSED_COMPONENTS, get_nlp
+from corpus import ENCODED_VERSION, EncodedChannel, build_encoded, get_encoded, iter_channel
+from lexicon_cache import model_version
+from profiling import PROFILER
+
+# bump when what is stored per token changes, this drops every annotated channel
+ANNOTATION_VERSION = 1
+# the annotations keep tags, morphology and lemmas, the dependency parse and entities are never computed
+ANNOTATION_UNUSED = UNUSED_COMPONENTS
+ANNOTATION_ATTRS = ['ORTH', 'LEMMA', 'POS', 'TAG', 'MORPH']
+# transcripts are long, so fewer of them go through the pipeline at once than anglicisms
+ANNOTATION_BATCH_SIZE = 32
+# videos per DocBin file, a run that stops loses at most this many videos of work
+SHARD_SIZE = 256
+
+def annotation_path(path: Path) -> Path:
+    return path.with_suffix('.spacy')
+
+
+def lemmas_path(path: Path) -> Path:
+    return path.with_suffix('.lemmas')
+
+
+def pipeline_id(model: str) -> dict:
+    # annotations made by another model, version or set of components are thrown away
+    return {'version': ANNOTATION_VERSION, 'model': model, 'model_version': model_version(model),
+            'unused': ANNOTATION_UNUSED}
+
+
+def write_json(path: Path, value) -> None:
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(value))
+    os.replace(tmp, path)
+
+
+def annotate_channel(path: Path, model: str = NLP_MODEL, batch_size: int = ANNOTATION_BATCH_SIZE,
+                     n_process: int = 1) -> dict:
+
+    # annotates every video of a channel with spaCy and stores the docs in output/<channel id>.spacy/,
+    # one DocBin file per SHARD_SIZE videos. meta.json lists the transcript hashes of the videos in each file,
+    # so a rerun only annotates videos that were added or changed since, and picks up after an interrupted run
+    directory = annotation_path(path)
+    hashes = get_encoded(path).hashes
+    pipeline = pipeline_id(model)
+
+    try:
+        meta = json.loads((directory / 'meta.json').read_text())
+    except (OSError, ValueError):
+        meta = None
+    if meta is None or meta['pipeline'] != pipeline:
+        shutil.rmtree(directory, ignore_errors=True)
+        meta = {'pipeline': pipeline, 'shards': []}
+    os.makedirs(directory, exist_ok=True)
+
+    # files are kept for as long as their videos match the start of the channel
+    done = 0
+    kept = []
+    for shard in meta['shards']:
+        if shard != hashes[done:done + len(shard)]:
+            break
+        kept.append(shard)
+        done += len(shard)
+    for f in directory.glob('*.spacy'):
+        if int(f.stem) >= len(kept):
+            f.unlink()
+    meta['shards'] = kept
+    write_json(directory / 'meta.json', meta)
+
+    if done == len(hashes):
+        return meta
+
+    from spacy.tokens import DocBin
+
+    print(f'Annotating {len(hashes) - done} videos of channel: {path.stem}')
+    nlp = get_nlp(model)
+    texts = (video['transcript'] for video in islice(iter_channel(path), done, None))
+    docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+
+    def save(shard: DocBin, shard_hashes: list[str]) -> None:
+        # the file is in place before meta.json mentions it, an unlisted file is overwritten next time
+        f = directory / f'{len(meta["shards"]):05d}.spacy'
+        shard.to_disk(f.with_suffix('.tmp'))
+        os.replace(f.with_suffix('.tmp'), f)
+        meta['shards'].append(shard_hashes)
+        write_json(directory / 'meta.json', meta)
+
+    with PROFILER.stage('annotate'):
+        shard, shard_hashes = DocBin(attrs=ANNOTATION_ATTRS), []
+        for doc, h in zip(docs, hashes[done:]):
+            shard.add(doc)
+            shard_hashes.append(h)
+            if len(shard_hashes) == SHARD_SIZE:
+                save(shard, shard_hashes)
+                shard, shard_hashes = DocBin(attrs=ANNOTATION_ATTRS), []
+        if shard_hashes:
+            save(shard, shard_hashes)
+
+    return meta
+
+
+def iter_docs(path: Path, meta: dict) -> Iterator:
+
+    # the annotated docs of a channel in video order, no pipeline needs to be loaded to read them
+    from spacy.tokens import DocBin
+    from spacy.vocab import Vocab
+
+    vocab = Vocab()
+    for i in range(len(meta['shards'])):
+        yield from DocBin().from_disk(annotation_path(path) / f'{i:05d}.spacy').get_docs(vocab)
+
+
+def get_lemmas(path: Path, model: str = NLP_MODEL, batch_size: int = ANNOTATION_BATCH_SIZE,
+               n_process: int = 1) -> EncodedChannel:
+
+    # the lemmas of every video as an encoded channel, made from the cached annotations (annotating first if needed).
+    # analyze can then match anglicisms against lemmas the same way it matches against the transcript tokens
+    meta = annotate_channel(path, model, batch_size, n_process)
+    directory = lemmas_path(path)
+    fingerprint = hashlib.sha1(json.dumps(meta).encode()).hexdigest()
+    encoded_meta = {'version': ENCODED_VERSION, 'tokenizer': 'spacy lemmas', 'source': fingerprint}
+    try:
+        if json.loads((directory / 'meta.json').read_text()) == encoded_meta:
+            return EncodedChannel(directory)
+    except (OSError, ValueError):
+        pass
+
+    print(f'Encoding lemmas of channel: {path.stem}')
+    pipeline = json.dumps(meta['pipeline'])
+    hashes = (h for shard in meta['shards'] for h in shard)
+    # titles and categories come from the encoded transcripts, which annotate_channel just brought up to date
+    tokens = get_encoded(path)
+    videos = ({'title': title, 'category': category} for title, category in zip(tokens.titles, tokens.categories))
+
+    def lemmatized() -> Iterator[tuple[list[str], str, dict]]:
+        for doc, h, video in zip(iter_docs(path, meta), hashes, videos):
+            # results are cached by this hash, so it has to differ from the hash of the same video's tokens
+            yield ([t.lemma_ or t.text for t in doc if not t.is_space],
+                   hashlib.sha1(f'{pipeline}:{h}'.encode()).hexdigest(), video)
+
+    return build_encoded(directory, encoded_meta, lemmatized())
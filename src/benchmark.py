@@ -0,0 +1,212 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from Anglicism import Anglicism
+from analysis import find_angilicisms, score_occurrences
+from corpus import encoded_path, get_encoded, iter_channel
+from entropy import encode
+from lexicon import Lexicon
+from matcher import Matcher
+from synthetic import make_lexicon, make_videos, make_vocabulary, write_channels
+
+# anglicisms in the lexicon, german words in the vocabulary, videos, tokens per video, channel files
+SCALES = {
+    'small': {'lexicon': 500, 'vocabulary': 2_000, 'videos': 50, 'length': 1_000, 'channels': 2},
+    'medium': {'lexicon': 5_000, 'vocabulary': 20_000, 'videos': 200, 'length': 2_000, 'channels': 4},
+    'large': {'lexicon': 20_000, 'vocabulary': 50_000, 'videos': 500, 'length': 5_000, 'channels': 8},
+}
+# share of transcript tokens that are anglicisms
+ANGLICISM_RATE = 0.01
+# Anglicism.calc_entropy is slow, only this many of its windows are timed
+REFERENCE_WINDOWS = 2_000
+BENCH_DIR = 'output/bench/'
+
+# libraries the analyze command must not load once the anglicism list exists
+HEAVY_MODULES = ['spacy', 'torch', 'pandas', 'requests', 'bs4', 'pdfminer']
+# seconds allowed for running analyze on a tiny corpus with a cached lexicon, mostly python and library startup
+STARTUP_BUDGET = 1.5
+# runs analysis.py in a fresh interpreter, then reports which heavy libraries it loaded on the last line of output
+STARTUP_SCRIPT = '''
+import json, runpy, sys
+script, modules = sys.argv[1], sys.argv[2:]
+sys.argv = [script, 'analyze']
+sys.path.insert(0, script.rsplit('/', 1)[0])
+try:
+    runpy.run_path(script, run_name='__main__')
+finally:
+    print(json.dumps([m for m in modules if m in sys.modules]))
+'''
+
+def measure(fn: Callable[[], object], repeat: int) -> dict[str, float]:
+
+    # best and mean wall time over repeat runs, plus the cpu time of the best run
+    walls, cpus = [], []
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        fn()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    best = min(range(repeat), key=walls.__getitem__)
+    return {'best': walls[best], 'mean': sum(walls) / repeat, 'cpu': cpus[best]}
+
+
+def reference_entropies(windows: list[tuple[Anglicism, list[str]]]) -> None:
+    for ang, words in windows:
+        ang.calc_entropy(words)
+
+
+def bench_scale(name: str, sizes: dict[str, int], repeat: int, seed: int, directory: str) -> list[dict]:
+
+    results = []
+    def record(stage: str, items: int, fn: Callable[[], object]) -> None:
+        timing = measure(fn, repeat)
+        per_second = items / timing['best'] if timing['best'] > 0 else None
+        results.append({'scale': name, 'stage': stage, 'items': items, **timing, 'per_second': per_second})
+        print(f'{name:>8} {stage:<20} {items:>10} items  best {timing["best"]:9.4f}s  mean {timing["mean"]:9.4f}s')
+
+    # lexicon: expanding morphologies, the compact format, and building the matcher
+    tagged = make_lexicon(sizes['lexicon'], seed)
+    record('lexicon_build', len(tagged), lambda: Lexicon.from_anglicisms(Anglicism.from_tagged(tagged)))
+    lexicon = Lexicon.from_anglicisms(Anglicism.from_tagged(tagged))
+    lexicon_path = os.path.join(directory, 'bench.lexicon')
+    record('lexicon_save_load', len(lexicon), lambda: (lexicon.save(lexicon_path), Lexicon.load(lexicon_path)))
+    record('matcher_build', len(lexicon), lambda: Matcher(lexicon))
+    matcher = Matcher(lexicon)
+
+    vocabulary = make_vocabulary(sizes['vocabulary'], seed)
+    videos = list(make_videos(sizes['videos'], sizes['length'], lexicon, vocabulary, ANGLICISM_RATE, seed))
+    transcripts = [v['transcript'].split() for v in videos]
+    tokens = sum(len(t) for t in transcripts)
+
+    # the stages of find_angilicisms on their own, then together
+    record('matching', tokens, lambda: [list(matcher.iter_occurrences(t)) for t in transcripts])
+    hits = [list(matcher.iter_occurrences(t)) for t in transcripts]
+    encoded = [encode(t) for t in transcripts]
+    record('entropy', sum(len(h) for h in hits),
+           lambda: [score_occurrences(iter(h), ids, vocab, True) for h, (ids, vocab) in zip(hits, encoded)])
+    windows = [(ang, t[max(0, offset - 25):offset + 25]) for h, t in zip(hits, transcripts) for ang, _, offset in h]
+    windows = windows[:REFERENCE_WINDOWS]
+    record('entropy_reference', len(windows), lambda: reference_entropies(windows))
+    record('find_angilicisms', tokens, lambda: [find_angilicisms(v, matcher, True) for v in videos])
+
+    # corpus files: parsing, encoding to token ids, and loading the encoded cache
+    corpus = os.path.join(directory, name)
+    os.makedirs(corpus)
+    paths = write_channels(corpus, sizes['channels'], iter(videos))
+    def encode_all() -> None:
+        for p in paths:
+            shutil.rmtree(encoded_path(p), ignore_errors=True)
+            get_encoded(p)
+    def load_all() -> None:
+        for p in paths:
+            channel = get_encoded(p)
+            for i in range(len(channel)):
+                channel.video(i).sum()
+
+    record('corpus_read', len(videos), lambda: [sum(1 for _ in iter_channel(p)) for p in paths])
+    record('corpus_encode', len(videos), encode_all)
+    record('corpus_load', tokens, load_all)
+    return results
+
+
+def bench_startup(repeat: int, seed: int, directory: str) -> tuple[list[dict], list[str]]:
+
+    # wall time of a whole analyze run in a new process, on a tiny corpus whose lexicon and results are already cached
+    script = str(Path(__file__).parent / 'analysis.py')
+    work = os.path.join(directory, 'startup')
+    os.makedirs(os.path.join(work, 'output'))
+    lexicon = Lexicon.from_anglicisms(Anglicism.from_tagged(make_lexicon(100, seed)))
+    lexicon.save(os.path.join(work, 'output', 'anglicisms.lexicon'))
+    write_channels(os.path.join(work, 'output'), 1, make_videos(5, 200, lexicon, make_vocabulary(500, seed), seed=seed))
+
+    def run() -> list[str]:
+        done = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, script, *HEAVY_MODULES], cwd=work,
+                              capture_output=True, text=True, check=True)
+        return json.loads(done.stdout.splitlines()[-1])
+
+    # the first run fills the caches
+    loaded = run()
+    timing = measure(run, repeat)
+    print(f'{"startup":>8} {"analyze":<20} {1:>10} items  best {timing["best"]:9.4f}s  mean {timing["mean"]:9.4f}s')
+    if loaded:
+        print(f'analyze loaded {", ".join(loaded)}')
+    return [{'scale': 'startup', 'stage': 'analyze', 'items': 1, **timing, 'per_second': None}], loaded
+
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(scales: list[str], repeat: int, seed: int, output: str|None, startup: bool = False,
+         budget: float = STARTUP_BUDGET) -> bool:
+
+    # returns False if the analyze startup went over budget or loaded a heavy library
+    results = []
+    passed = True
+    with tempfile.TemporaryDirectory() as directory:
+        for name in scales:
+            results.extend(bench_scale(name, SCALES[name], repeat, seed, directory))
+        if startup:
+            startup_results, loaded = bench_startup(repeat, seed, directory)
+            results.extend(startup_results)
+            if startup_results[0]['best'] > budget:
+                print(f'analyze startup took {startup_results[0]["best"]:.2f}s, over the budget of {budget:.2f}s')
+                passed = False
+            passed = passed and not loaded
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'scales': {name: SCALES[name] for name in scales},
+        'results': results,
+        'startup_budget': budget if startup else None,
+        'passed': passed,
+    }
+    if output is None:
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        output = os.path.join(BENCH_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    Path(output).write_text(json.dumps(report, indent=2))
+    print(f'Results written to file: {output}')
+    return passed
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='Benchmarks')
+    parser.add_argument("--scales", nargs="*", choices=list(SCALES), default=['small', 'medium'],
+                        help="corpus and lexicon sizes to run.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of times each stage is timed, the best time is reported.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the generated data, the same seed always gives the same data.")
+    parser.add_argument("--output",
+                        help="json file the results are written to (default: output/bench/<date>.json).")
+    parser.add_argument("--startup", action="store_true",
+                        help="also time the analyze command in a new process and fail if it is over budget.")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET,
+                        help="seconds the analyze startup may take.")
+
+    args = parser.parse_args()
+    if not main(args.scales, args.repeat, args.seed, args.output, args.startup, args.startup_budget):
+        sys.exit(1)
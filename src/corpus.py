@@ -0,0 +1,332 @@
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from profiling import PROFILER
+
+CORPUS_DIR = 'output/'
+# characters read from a channel file at a time
+READ_SIZE = 1 << 16
+# pages written to a channel file between fsyncs. a crash can lose the pages since the last fsync, which are
+# scraped again on the next run. raising it trades that for fewer disk flushes
+SYNC_EVERY = 1
+
+DECODER = json.JSONDecoder()
+
+# bump when the way transcripts are split into tokens changes, this invalidates every encoded channel
+TOKENIZER = 'str.split'
+# 3: titles and categories are kept next to the token ids
+ENCODED_VERSION = 3
+
+class JSONStream():
+    '''
+    Reads json values one at a time from a file, so only the value being parsed is held in memory.
+    '''
+    def __init__(self, f: TextIO) -> None:
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+
+    def fill(self, size: int|None = None) -> None:
+        chunk = self.f.read(size or READ_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+
+    def peek(self) -> str:
+
+        # skip whitespace, reading more of the file when the buffer runs out
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                break
+            self.fill()
+
+        return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'expected "{char}" at position {self.pos} of {self.f.name}, found "{found}"')
+        self.pos += 1
+
+
+    def skip(self, char: str) -> None:
+        if self.peek() == char:
+            self.pos += 1
+
+
+    def value(self):
+
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # a number that ends the buffer may continue in the next read
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            # grow the reads with the buffer so a long value is not re-parsed once per chunk
+            self.fill(max(READ_SIZE, len(self.buf)))
+
+
+def channel_paths(directory: str = CORPUS_DIR) -> list[Path]:
+
+    # one file per channel, an append only .jsonl file takes the place of an older .json file of the same channel
+    paths = {p.stem: p for p in Path(directory).glob('*.json')}
+    paths.update({p.stem: p for p in Path(directory).glob('*.jsonl')})
+    return sorted(paths.values())
+
+
+def iter_channel(path: Path) -> Iterator[dict]:
+
+    if path.suffix == '.jsonl':
+        yield from iter_channel_lines(path)
+        return
+
+    # yields the videos of a channel file ({"id": ..., "transcripts": [...]}) one at a time
+    with open(path, 'r') as f:
+        stream = JSONStream(f)
+        stream.expect('{')
+        while stream.peek() != '}':
+            key = stream.value()
+            stream.expect(':')
+            if key == 'transcripts':
+                stream.expect('[')
+                while stream.peek() != ']':
+                    yield stream.value()
+                    stream.skip(',')
+                stream.expect(']')
+            else:
+                stream.value()
+            stream.skip(',')
+
+
+def iter_channel_lines(path: Path) -> Iterator[dict]:
+
+    # yields the videos of an append only channel file (see ChannelWriter), page by page.
+    # videos after the last commit record belong to a page that was never finished and are left out
+    page = []
+    with open(path, 'r', encoding='utf-8') as f:
+        f.readline()
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            record = json.loads(line)
+            if 'commit' in record:
+                yield from page
+                page = []
+            else:
+                page.append(record)
+
+
+class ChannelWriter():
+    '''
+    Appends pages of videos to output/<channel id>.jsonl.
+    The first line is a header, then every video is one json line and each page ends with a commit record
+    ({"commit": videos so far, "next": next page token}). A page only counts once its commit record is written,
+    so a crash never leaves a half written page behind.
+    '''
+    def __init__(self, channelId: str, directory: str = CORPUS_DIR, resume: bool = True, sync_every: int = SYNC_EVERY) -> None:
+
+        self.path = Path(directory) / f'{channelId}.jsonl'
+        # pages are fsync'd in batches of sync_every
+        self.sync_every = sync_every
+        self.unsynced = 0
+        # videos and pages committed so far
+        self.count = 0
+        self.pages = 0
+        # page token after the last committed page, None if the channel starts from the beginning
+        self.next_token: str|None = None
+
+        if resume and self.path.exists():
+            end = self.recover()
+            self.f = open(self.path, 'r+b')
+            # drop whatever follows the last commit
+            self.f.truncate(end)
+            self.f.seek(end)
+        else:
+            self.f = open(self.path, 'wb')
+            self.f.write(json.dumps({'id': channelId}).encode() + b'\n')
+            self.sync()
+
+
+    def recover(self) -> int:
+
+        # offset just past the last complete commit record
+        with open(self.path, 'rb') as f:
+            end = len(f.readline())
+            offset = end
+            for line in f:
+                offset += len(line)
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if 'commit' in record:
+                    end = offset
+                    self.pages += 1
+                    self.count = record['commit']
+                    self.next_token = record['next']
+        return end
+
+
+    def write_page(self, videos: list[dict], next_token: str|None) -> None:
+
+        # cost only depends on the size of the page, not on what was written before
+        self.count += len(videos)
+        lines = [json.dumps(v, ensure_ascii=False) for v in videos]
+        lines.append(json.dumps({'commit': self.count, 'next': next_token}))
+        self.f.write(('\n'.join(lines) + '\n').encode())
+        self.next_token = next_token
+        self.pages += 1
+
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+
+    def sync(self) -> None:
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.unsynced = 0
+
+
+    def close(self) -> None:
+        self.sync()
+        self.f.close()
+
+
+def iter_videos(directory: str = CORPUS_DIR) -> Iterator[tuple[str, dict]]:
+
+    # yields (channel id, video) for every video in the corpus, one at a time
+    for path in channel_paths(directory):
+        for video in iter_channel(path):
+            yield path.stem, video
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class EncodedChannel():
+    '''
+    Token ids of every video of a channel, memory mapped from the cache next to the channel file.
+    All videos of the channel share one vocabulary.
+    '''
+    def __init__(self, directory: Path) -> None:
+
+        self.directory = directory
+        self.vocab: list[str] = json.loads((directory / 'vocab.json').read_text())
+        # sha1 of each video's transcript
+        self.hashes: list[str] = json.loads((directory / 'hashes.json').read_text())
+        # metadata of each video, so results can be grouped without parsing the channel file again
+        info = json.loads((directory / 'videos.json').read_text())
+        self.titles: list[str|None] = info['titles']
+        self.categories: list[str|None] = info['categories']
+        # video i is ids[offsets[i]:offsets[i+1]]
+        self.offsets = np.load(directory / 'offsets.npy')
+        if self.offsets[-1] > 0:
+            self.ids = np.memmap(directory / 'ids.bin', dtype=np.int32, mode='r')
+        else:
+            # an empty file cannot be memory mapped
+            self.ids = np.zeros(0, dtype=np.int32)
+
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+    def video(self, i: int) -> np.ndarray:
+        # a view into the mapped file, nothing is copied
+        return self.ids[self.offsets[i]:self.offsets[i+1]]
+
+
+def encoded_path(path: Path) -> Path:
+    return path.with_suffix('.tokens')
+
+
+def get_encoded(path: Path) -> EncodedChannel:
+
+    # encoded channels are rebuilt whenever the channel file or the tokenizer changed
+    directory = encoded_path(path)
+    meta = {'version': ENCODED_VERSION, 'tokenizer': TOKENIZER, 'source': file_hash(path)}
+    try:
+        if json.loads((directory / 'meta.json').read_text()) == meta:
+            with PROFILER.stage('channel_load'):
+                return EncodedChannel(directory)
+    except (OSError, ValueError):
+        pass
+
+    print(f'Encoding transcripts of channel: {path.stem}')
+
+    def tokenized() -> Iterator[tuple[list[str], str, dict]]:
+        videos = iter_channel(path)
+        while True:
+            with PROFILER.stage('json'):
+                video = next(videos, None)
+            if video is None:
+                return
+            with PROFILER.stage('tokenize'):
+                tokens = video['transcript'].split()
+                h = hashlib.sha1(video['transcript'].encode()).hexdigest()
+            yield tokens, h, video
+
+    return build_encoded(directory, meta, tokenized())
+
+
+def build_encoded(directory: Path, meta: dict, videos: Iterable[tuple[list[str], str, dict]]) -> EncodedChannel:
+
+    # writes (tokens, hash, video) of each video as an encoded channel, meta is what decides whether it is still valid.
+    # only the title and category of the video dict are kept
+    tmp = directory.with_suffix(directory.suffix + '.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.mkdir(tmp)
+
+    vocab: dict[str, int] = {}
+    offsets = [0]
+    hashes = []
+    titles, categories = [], []
+    # ids are written out video by video so memory stays flat
+    with open(tmp / 'ids.bin', 'wb') as f:
+        for tokens, h, video in videos:
+            with PROFILER.stage('encode'):
+                ids = array('i', [vocab.setdefault(t, len(vocab)) for t in tokens])
+                ids.tofile(f)
+                offsets.append(offsets[-1] + len(ids))
+                hashes.append(h)
+                titles.append(video.get('title'))
+                categories.append(video.get('category'))
+
+    (tmp / 'vocab.json').write_text(json.dumps(list(vocab), ensure_ascii=False))
+    (tmp / 'hashes.json').write_text(json.dumps(hashes))
+    (tmp / 'videos.json').write_text(json.dumps({'titles': titles, 'categories': categories}, ensure_ascii=False))
+    np.save(tmp / 'offsets.npy', np.asarray(offsets, dtype=np.int64))
+    # written last, an interrupted build never looks valid
+    (tmp / 'meta.json').write_text(json.dumps(meta))
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+    return EncodedChannel(directory)
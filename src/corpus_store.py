@@ -0,0 +1,176 @@
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+import os
+import re
+import sqlite3
+
+from corpus import file_hash, iter_channel
+from lexicon import Lexicon
+
+CORPUS_STORE_PATH = 'output/corpus.sqlite'
+# words of context on each side of a hit in a snippet
+SNIPPET_TOKENS = 12
+
+# the same characters the fts5 unicode61 tokenizer keeps, everything else separates tokens
+TOKEN = re.compile(r'[^\W_]+')
+
+class CorpusStore():
+    '''
+    The scraped channels in one sqlite database with a full text (fts5) index over the transcripts,
+    for quick lookups of where and how often a word is used without running a whole analysis.
+    Matching ignores case and punctuation, unlike analyze which compares whole tokens exactly.
+    '''
+    def __init__(self, path: str = CORPUS_STORE_PATH) -> None:
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS channels (
+                channel TEXT PRIMARY KEY, source TEXT
+            );
+            CREATE TABLE IF NOT EXISTS videos (
+                id INTEGER PRIMARY KEY, channel TEXT, position INTEGER, title TEXT, category TEXT, transcript TEXT
+            );
+            CREATE INDEX IF NOT EXISTS videos_channel ON videos (channel);
+            CREATE INDEX IF NOT EXISTS videos_category ON videos (category);
+            -- the index reads transcripts from the videos table instead of keeping a second copy
+            CREATE VIRTUAL TABLE IF NOT EXISTS transcripts USING fts5 (
+                transcript, content='videos', content_rowid='id', tokenize='unicode61 remove_diacritics 0'
+            );
+            -- one row per indexed token: (term, doc, col, offset)
+            CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5vocab (transcripts, 'instance');
+        ''')
+
+
+    def ingest(self, paths: Iterable[Path]) -> tuple[int, int]:
+
+        # (channels added or updated, channels removed), channel files that did not change are skipped
+        known = dict(self.db.execute('SELECT channel, source FROM channels').fetchall())
+        updated = 0
+        seen = set()
+        for path in paths:
+            seen.add(path.stem)
+            source = file_hash(path)
+            if known.get(path.stem) == source:
+                continue
+
+            print(f'Ingesting channel: {path.stem}')
+            with self.db:
+                self.remove(path.stem)
+                for position, video in enumerate(iter_channel(path)):
+                    cursor = self.db.execute('INSERT INTO videos VALUES (NULL, ?, ?, ?, ?, ?)',
+                                             (path.stem, position, video.get('title'), video.get('category'),
+                                              video['transcript']))
+                    self.db.execute('INSERT INTO transcripts (rowid, transcript) VALUES (?, ?)',
+                                    (cursor.lastrowid, video['transcript']))
+                self.db.execute('INSERT OR REPLACE INTO channels VALUES (?, ?)', (path.stem, source))
+            updated += 1
+
+        removed = [c for c in known if c not in seen]
+        with self.db:
+            for channel in removed:
+                self.remove(channel)
+        return updated, len(removed)
+
+
+    def remove(self, channel: str) -> None:
+        # an external content index has to be told the old text of every row it drops
+        self.db.execute('''INSERT INTO transcripts (transcripts, rowid, transcript)
+                           SELECT 'delete', id, transcript FROM videos WHERE channel = ?''', (channel, ))
+        self.db.execute('DELETE FROM videos WHERE channel = ?', (channel, ))
+        self.db.execute('DELETE FROM channels WHERE channel = ?', (channel, ))
+
+
+    def filters(self, category: str|None, channel: str|None) -> tuple[str, list[str]]:
+        sql, params = '', []
+        if category is not None:
+            sql += ' AND v.category = ?'
+            params.append(category)
+        if channel is not None:
+            sql += ' AND v.channel = ?'
+            params.append(channel)
+        return sql, params
+
+
+    def instances(self, token: str, category: str|None = None, channel: str|None = None) -> set[tuple[int, int]]:
+
+        # (video, token offset) of every occurrence of a single token
+        where, params = self.filters(category, channel)
+        rows = self.db.execute(f'''SELECT t.doc, t.offset FROM terms t JOIN videos v ON v.id = t.doc
+                                   WHERE t.term = ?{where}''', [token.lower(), *params])
+        return set(rows.fetchall())
+
+
+    def occurrences(self, forms: Iterable[str], category: str|None = None, channel: str|None = None,
+                    cache: dict|None = None) -> Counter:
+
+        # video id -> number of occurrences of any of the forms, multi word forms count where their tokens follow
+        # each other. cache keeps the instances of each token between calls
+        cache = {} if cache is None else cache
+        counts: Counter = Counter()
+        # forms that only differ in case or punctuation are the same to the index
+        for tokens in {tuple(TOKEN.findall(form.lower())) for form in forms} - {()}:
+            hits = None
+            for k, token in enumerate(tokens):
+                if (token, category, channel) not in cache:
+                    cache[(token, category, channel)] = self.instances(token, category, channel)
+                shifted = {(doc, offset - k) for doc, offset in cache[(token, category, channel)]}
+                hits = shifted if hits is None else hits & shifted
+            counts.update(doc for doc, _ in hits)
+        return counts
+
+
+    def query(self, forms: Iterable[str], category: str|None = None, channel: str|None = None, limit: int = 20,
+              snippets: bool = True) -> list[dict]:
+
+        # videos using any of the forms, most occurrences first, with a snippet of the best match in each
+        forms = [f for f in set(forms) if TOKEN.search(f)]
+        counts = self.occurrences(forms, category, channel)
+        match = ' OR '.join('"' + ' '.join(TOKEN.findall(f)) + '"' for f in forms)
+
+        out = []
+        for doc, count in counts.most_common(limit):
+            channel_id, title, video_category = self.db.execute('SELECT channel, title, category FROM videos WHERE id = ?',
+                                                                (doc, )).fetchone()
+            hit = {'channel': channel_id, 'title': title, 'category': video_category, 'count': count}
+            if snippets:
+                (hit['snippet'], ) = self.db.execute(
+                    "SELECT snippet(transcripts, 0, '[', ']', '...', ?) FROM transcripts WHERE transcripts MATCH ? AND rowid = ?",
+                    (SNIPPET_TOKENS, match, doc)).fetchone()
+            out.append(hit)
+        return out
+
+
+    def counts(self, lexicon: Lexicon, category: str|None = None, channel: str|None = None) -> dict[str, tuple[int, int]]:
+
+        # anglicism -> (occurrences, videos), for every anglicism found at least once.
+        # an anglicism listed with several parts of speech is counted once with the forms of all of them
+        forms: dict[str, set[str]] = {}
+        for i in range(len(lexicon)):
+            forms.setdefault(lexicon.angs[i], {lexicon.angs[i]}).update(lexicon.morphologies(i))
+
+        # the instances of every token of every form come back from one query. CROSS JOIN keeps wanted as the outer
+        # loop, so the vocab table looks each term up in the index instead of scanning every token of the corpus
+        tokens = {token for ang_forms in forms.values() for form in ang_forms for token in TOKEN.findall(form.lower())}
+        with self.db:
+            self.db.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (term TEXT PRIMARY KEY)')
+            self.db.execute('DELETE FROM wanted')
+            self.db.executemany('INSERT INTO wanted VALUES (?)', [(t, ) for t in tokens])
+        where, params = self.filters(category, channel)
+        cache: dict = {(token, category, channel): set() for token in tokens}
+        rows = self.db.execute(f'''SELECT t.term, t.doc, t.offset FROM wanted w CROSS JOIN terms t ON t.term = w.term
+                                   JOIN videos v ON v.id = t.doc{where}''', params)
+        for term, doc, offset in rows:
+            cache[(term, category, channel)].add((doc, offset))
+
+        out = {}
+        for ang, ang_forms in forms.items():
+            found = self.occurrences(ang_forms, category, channel, cache)
+            if found:
+                out[ang] = (sum(found.values()), len(found))
+        return out
+
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,45 @@
+from typing import Sequence
+
+import numpy as np
+
+def encode(tokens: Sequence[str]) -> tuple[np.ndarray, dict[str, int]]:
+
+    # give every distinct token an integer id, in order of first appearance
+    vocab: dict[str, int] = {}
+    ids = np.fromiter((vocab.setdefault(t, len(vocab)) for t in tokens), dtype=np.int64, count=len(tokens))
+    return ids, vocab
+
+
+def window_entropies(ids: np.ndarray, windows: Sequence[tuple[int, int]], excluded: Sequence[Sequence[int]],
+                     vocab_size: int) -> list[float]:
+
+    # shannon entropy (base 2) of the tokens in each [lower, upper) window of ids,
+    # leaving out the token ids listed for that window in excluded (the forms of the anglicism that was hit).
+    # every window is computed in the same numpy pass, this gives the same values as Anglicism.calc_entropy
+    n = len(windows)
+    if n == 0:
+        return []
+
+    bounds = np.asarray(windows, dtype=np.int64).reshape(n, 2)
+    lengths = bounds[:, 1] - bounds[:, 0]
+    starts = np.cumsum(lengths) - lengths
+
+    # window number and token id of every position in every window
+    window = np.repeat(np.arange(n, dtype=np.int64), lengths)
+    positions = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(starts - bounds[:, 0], lengths)
+    # a (window, token) pair packed into one integer
+    vocab_size = max(vocab_size, 1)
+    keys = window * vocab_size + ids[positions]
+
+    skip = [np.asarray(e, dtype=np.int64) + i * vocab_size for i, e in enumerate(excluded) if len(e)]
+    if skip:
+        keys = keys[~np.isin(keys, np.concatenate(skip))]
+
+    # count each token in each window, then turn the counts into probabilities per window
+    pairs, counts = np.unique(keys, return_counts=True)
+    owner = pairs // vocab_size
+    totals = np.bincount(owner, weights=counts, minlength=n)
+    probabilities = counts / totals[owner]
+    entropies = -np.bincount(owner, weights=probabilities * np.log2(probabilities), minlength=n)
+
+    return entropies.astype(np.float64).tolist()
@@ -0,0 +1,151 @@
+from array import array
+from itertools import repeat
+
+import numpy as np
+
+from Anglicism import Anglicism
+from lexicon import Lexicon
+
+# fuzzy matching leaves out short words, a typo in them is as likely to be an ordinary german word
+FUZZY_MIN_LENGTH = 5
+# words shorter than this may only be one edit away from a form
+FUZZY_LONG_LENGTH = 8
+FUZZY_MAX_DISTANCE = 2
+
+def deletes(word: str, max_distance: int) -> set[str]:
+    # word with up to max_distance characters left out
+    out = {word}
+    edge = {word}
+    for _ in range(max_distance):
+        edge = {w[:i] + w[i+1:] for w in edge for i in range(len(w))}
+        out |= edge
+    return out
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+
+    # optimal string alignment distance (insertions, deletions, substitutions and swaps of neighbouring letters),
+    # anything over limit comes back as limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    # forms of one anglicism share most of their letters, only the part where the words differ needs comparing
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1-end] == b[-1-end]:
+        end += 1
+    a, b = a[start:len(a)-end], b[start:len(b)-end]
+    if not a or not b:
+        return min(max(len(a), len(b)), limit + 1)
+
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i-1] != b[j-1]
+            current[j] = min(previous[j] + 1, current[j-1] + 1, previous[j-1] + cost)
+            if before is not None and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                current[j] = min(current[j], before[j-2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyIndex():
+    '''
+    Symmetric delete (SymSpell style) index over every single word form in the lexicon, for finding tokens that are
+    a typo or two away from an anglicism (ex: misspellings in automatic captions). Comparisons ignore case.
+    '''
+    def __init__(self, lexicon: Lexicon, max_distance: int = FUZZY_MAX_DISTANCE) -> None:
+
+        self.lexicon = lexicon
+        self.max_distance = max_distance
+        # exact forms are left to the matcher
+        self.exact: set[str] = set(lexicon.forms)
+
+        # lowercased forms, and the lexicon positions of the anglicisms each one belongs to
+        self.words: list[str] = []
+        self.originals: list[str] = []
+        self.positions: list[list[int]] = []
+        # lowercased form -> its position in words
+        self.ids: dict[str, int] = {}
+        for i in range(len(lexicon)):
+            for form in lexicon.morphologies(i):
+                if len(form) >= FUZZY_MIN_LENGTH and ' ' not in form:
+                    word = form.lower()
+                    if word not in self.ids:
+                        self.ids[word] = len(self.words)
+                        self.words.append(word)
+                        self.originals.append(form)
+                        self.positions.append([])
+                    # an anglicism can list the same form for several cases
+                    if i not in self.positions[self.ids[word]]:
+                        self.positions[self.ids[word]].append(i)
+
+        # every delete of every form, as a sorted array of string hashes next to the form each came from.
+        # millions of deletes fit in a few arrays where a dict of strings would not.
+        # str hashes differ between processes, so the index is only used by the process that built it
+        keys, owners = array('q'), array('i')
+        for n, word in enumerate(self.words):
+            found = deletes(word, max_distance)
+            keys.extend(map(hash, found))
+            owners.extend(repeat(n, len(found)))
+        order = np.argsort(np.frombuffer(keys, dtype=np.int64), kind='stable')
+        self.keys = np.frombuffer(keys, dtype=np.int64)[order]
+        self.owners = np.frombuffer(owners, dtype=np.int32)[order]
+
+        # token -> lookup result, transcripts repeat the same words a lot
+        self.memo: dict[str, list[tuple[Anglicism, str, int]]] = {}
+
+
+    def allowed(self, token: str) -> int:
+        return min(1 if len(token) < FUZZY_LONG_LENGTH else 2, self.max_distance)
+
+
+    def candidates(self, word: str, limit: int) -> set[int]:
+
+        # forms sharing a delete with the word, a superset of the forms within limit edits of it
+        hashes = np.fromiter((hash(key) for key in deletes(word, limit)), dtype=np.int64)
+        lower = np.searchsorted(self.keys, hashes, 'left').tolist()
+        upper = np.searchsorted(self.keys, hashes, 'right').tolist()
+        out = set()
+        for lo, hi in zip(lower, upper):
+            if lo < hi:
+                out.update(self.owners[lo:hi].tolist())
+        return out
+
+
+    def lookup(self, token: str) -> list[tuple[Anglicism, str, int]]:
+
+        # (anglicism, form, edit distance) of the closest forms to a token, one per anglicism even when several of its
+        # forms (or its entries for several parts of speech) are as close. empty for exact forms, unmatched tokens
+        # and tokens that only differ from a form in letter case (ex: a capitalized word), which are not misspellings
+        if token in self.memo:
+            return self.memo[token]
+
+        out = []
+        word = token.lower()
+        if len(token) >= FUZZY_MIN_LENGTH and token not in self.exact and word not in self.ids:
+            limit = self.allowed(word)
+            best = limit + 1
+            found: list[int] = []
+            for n in self.candidates(word, limit):
+                distance = edit_distance(word, self.words[n], min(limit, best))
+                if distance < best:
+                    best, found = distance, [n]
+                elif distance == best and distance <= limit:
+                    found.append(n)
+            seen = set()
+            for n in sorted(found):
+                for i in self.positions[n]:
+                    ang = self.lexicon[i]
+                    if ang.ang not in seen:
+                        seen.add(ang.ang)
+                        out.append((ang, self.originals[n], best))
+
+        self.memo[token] = out
+        return out
@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+import time
+
+JOBS_PATH = 'output/jobs.sqlite'
+
+# job states
+PENDING = 'pending'
+RUNNING = 'running'
+# stopped early (ex: out of quota), resumed on the next run
+STOPPED = 'stopped'
+FAILED = 'failed'
+DONE = 'done'
+
+class JobQueue():
+    '''
+    Persistent queue of channels to scrape, with the page token each channel has reached.
+    Safe to share between threads.
+    '''
+    def __init__(self, path: str = JOBS_PATH) -> None:
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                channel TEXT PRIMARY KEY, position INTEGER, status TEXT, page_token TEXT, updated REAL
+            )
+        ''')
+        self.db.commit()
+
+
+    def add(self, channels: list[str]) -> None:
+
+        # channels already in the queue keep their state
+        with self.lock:
+            (count, ) = self.db.execute('SELECT COUNT(*) FROM jobs').fetchone()
+            self.db.executemany('INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, NULL, ?)',
+                                [(c, count + i, PENDING, time.time()) for i, c in enumerate(channels)])
+            self.db.commit()
+
+
+    def recover(self) -> None:
+
+        # anything that did not finish in an earlier run (crashed, stopped or failed) is picked up again
+        with self.lock:
+            self.db.execute('UPDATE jobs SET status = ? WHERE status IN (?, ?, ?)', (PENDING, RUNNING, STOPPED, FAILED))
+            self.db.commit()
+
+
+    def claim(self) -> tuple[str, str|None]|None:
+
+        # (channel, page token) of the next pending channel, now marked as running
+        with self.lock:
+            row = self.db.execute('SELECT channel, page_token FROM jobs WHERE status = ? ORDER BY position LIMIT 1',
+                                  (PENDING, )).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE jobs SET status = ?, updated = ? WHERE channel = ?', (RUNNING, time.time(), row[0]))
+            self.db.commit()
+            return row
+
+
+    def checkpoint(self, channel: str, page_token: str|None) -> None:
+        with self.lock:
+            self.db.execute('UPDATE jobs SET page_token = ?, updated = ? WHERE channel = ?',
+                            (page_token, time.time(), channel))
+            self.db.commit()
+
+
+    def finish(self, channel: str, status: str) -> None:
+        with self.lock:
+            self.db.execute('UPDATE jobs SET status = ?, updated = ? WHERE channel = ?', (status, time.time(), channel))
+            self.db.commit()
+
+
+    def summary(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,139 @@
+from array import array
+from typing import Iterable, Iterator
+import hashlib
+import json
+import os
+import sys
+
+from Anglicism import Anglicism
+
+LEXICON_PATH = 'output/anglicisms.lexicon'
+LEXICON_FORMAT = 'anglicism-lexicon'
+LEXICON_VERSION = 1
+
+class Lexicon():
+    '''
+    Compact, list like container of anglicisms.
+    Every distinct form is stored once in a shared string table and each anglicism is a range of form ids.
+    '''
+    __slots__ = ('angs', 'pos', 'forms', 'form_ids', 'offsets', '_anglicisms')
+
+    def __init__(self, angs: list[str], pos: list[str], forms: list[str], form_ids: array, offsets: array) -> None:
+
+        self.angs = angs
+        self.pos = pos
+        self.forms = forms
+        # the forms of anglicism i are forms[form_ids[offsets[i]:offsets[i+1]]]
+        self.form_ids = form_ids
+        self.offsets = offsets
+        # Anglicism objects are only built when asked for
+        self._anglicisms: list[Anglicism|None] = [None] * len(angs)
+
+
+    @classmethod
+    def from_anglicisms(cls, anglicisms: Iterable[Anglicism]) -> 'Lexicon':
+
+        angs, pos, forms = [], [], []
+        form_ids, offsets = array('I'), array('I', [0])
+        table: dict[str, int] = {}
+
+        for a in anglicisms:
+            angs.append(a.ang)
+            pos.append(sys.intern(a.pos))
+            for form in a.morphologies:
+                if form not in table:
+                    table[form] = len(forms)
+                    forms.append(sys.intern(form))
+                form_ids.append(table[form])
+            offsets.append(len(form_ids))
+
+        return cls(angs, pos, forms, form_ids, offsets)
+
+
+    def morphologies(self, i: int) -> list[str]:
+        forms = self.forms
+        return [forms[f] for f in self.form_ids[self.offsets[i]:self.offsets[i+1]]]
+
+
+    def entries(self) -> list[tuple[str, str, tuple[str, ...]]]:
+        return [(self.angs[i], self.pos[i], tuple(self.morphologies(i))) for i in range(len(self))]
+
+
+    def fingerprint(self) -> str:
+        # changes whenever any word, part of speech or form changes
+        h = hashlib.sha1()
+        for entry in self.entries():
+            h.update(json.dumps(entry, ensure_ascii=False).encode())
+        return h.hexdigest()
+
+
+    def __len__(self) -> int:
+        return len(self.angs)
+
+
+    def __getitem__(self, i: int) -> Anglicism:
+
+        if i < 0:
+            i += len(self)
+        a = self._anglicisms[i]
+        if a is None:
+            a = Anglicism.from_parts(self.angs[i], self.pos[i], self.morphologies(i))
+            self._anglicisms[i] = a
+        return a
+
+
+    def __iter__(self) -> Iterator[Anglicism]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def __reduce__(self):
+        # only the tables are pickled (ex: when sent to worker processes), not the built Anglicism objects
+        return (self.__class__, (self.angs, self.pos, self.forms, self.form_ids, self.offsets))
+
+
+    def save(self, path: str = LEXICON_PATH) -> None:
+
+        # layout: a json header line, a json line with the string tables,
+        # then the raw bytes of form_ids followed by offsets (uint32, little endian)
+        form_ids, offsets = array('I', self.form_ids), array('I', self.offsets)
+        if sys.byteorder != 'little':
+            form_ids.byteswap()
+            offsets.byteswap()
+
+        header = {'format': LEXICON_FORMAT, 'version': LEXICON_VERSION,
+                  'count': len(self), 'form_ids': len(form_ids), 'offsets': len(offsets)}
+        tables = [self.angs, self.pos, self.forms]
+
+        # write to a temporary file first so a crash never leaves half a lexicon behind
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            f.write(json.dumps(tables, ensure_ascii=False).encode() + b'\n')
+            f.write(form_ids.tobytes())
+            f.write(offsets.tobytes())
+        os.replace(tmp, path)
+
+
+    @classmethod
+    def load(cls, path: str = LEXICON_PATH) -> 'Lexicon':
+
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('format') != LEXICON_FORMAT:
+                raise ValueError(f'{path} is not an anglicism lexicon')
+            if header.get('version') != LEXICON_VERSION:
+                raise ValueError(f'{path} has lexicon format version {header.get("version")}, expected {LEXICON_VERSION}')
+
+            angs, pos, forms = json.loads(f.readline())
+            form_ids, offsets = array('I'), array('I')
+            form_ids.frombytes(f.read(header['form_ids'] * form_ids.itemsize))
+            offsets.frombytes(f.read(header['offsets'] * offsets.itemsize))
+
+        if sys.byteorder != 'little':
+            form_ids.byteswap()
+            offsets.byteswap()
+
+        pos = [sys.intern(p) for p in pos]
+        forms = [sys.intern(f) for f in forms]
+        return cls(angs, pos, forms, form_ids, offsets)
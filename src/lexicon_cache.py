@@ -0,0 +1,105 @@
+from importlib import metadata
+from typing import Iterable
+import json
+import os
+import sqlite3
+import time
+
+from Anglicism import rules_fingerprint
+
+LEXICON_CACHE_PATH = 'output/cache/lexicon.sqlite'
+
+class LexiconCache():
+    '''
+    On disk cache of part of speech tags and expanded morphologies, keyed by the word itself.
+    Tags are stored per model name and version, morphologies per version of the morphology rules in Anglicism.py.
+    '''
+    def __init__(self, path: str = LEXICON_CACHE_PATH, max_entries: int = 100_000) -> None:
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.rules = rules_fingerprint()
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS pos (
+                word TEXT, model TEXT, version TEXT, pos TEXT, used REAL,
+                PRIMARY KEY (word, model, version)
+            );
+            CREATE TABLE IF NOT EXISTS morphologies (
+                word TEXT, pos TEXT, rules TEXT, forms TEXT, used REAL,
+                PRIMARY KEY (word, pos, rules)
+            );
+        ''')
+        # morphologies built by older rules can never be hit again
+        self.db.execute('DELETE FROM morphologies WHERE rules != ?', (self.rules,))
+        self.db.commit()
+
+
+    def get_pos(self, words: Iterable[str], model: str) -> dict[str, str]:
+
+        version = model_version(model)
+        found = {}
+        for word in set(words):
+            row = self.db.execute('SELECT pos FROM pos WHERE word = ? AND model = ? AND version = ?',
+                                  (word, model, version)).fetchone()
+            if row is not None:
+                found[word] = row[0]
+
+        self.db.executemany('UPDATE pos SET used = ? WHERE word = ? AND model = ? AND version = ?',
+                            [(time.time(), word, model, version) for word in found])
+        self.db.commit()
+        return found
+
+
+    def put_pos(self, tags: dict[str, str], model: str) -> None:
+
+        version = model_version(model)
+        self.db.executemany('INSERT OR REPLACE INTO pos VALUES (?, ?, ?, ?, ?)',
+                            [(word, model, version, pos, time.time()) for word, pos in tags.items()])
+        self._evict('pos')
+
+
+    def get_morphologies(self, tagged: Iterable[tuple[str, str]]) -> dict[tuple[str, str], list[str]]:
+
+        found = {}
+        for word, pos in set(tagged):
+            row = self.db.execute('SELECT forms FROM morphologies WHERE word = ? AND pos = ? AND rules = ?',
+                                  (word, pos, self.rules)).fetchone()
+            if row is not None:
+                found[(word, pos)] = json.loads(row[0])
+
+        self.db.executemany('UPDATE morphologies SET used = ? WHERE word = ? AND pos = ? AND rules = ?',
+                            [(time.time(), word, pos, self.rules) for (word, pos) in found])
+        self.db.commit()
+        return found
+
+
+    def put_morphologies(self, morphologies: dict[tuple[str, str], list[str]]) -> None:
+
+        self.db.executemany('INSERT OR REPLACE INTO morphologies VALUES (?, ?, ?, ?, ?)',
+                            [(word, pos, self.rules, json.dumps(forms, ensure_ascii=False), time.time())
+                             for (word, pos), forms in morphologies.items()])
+        self._evict('morphologies')
+
+
+    def _evict(self, table: str) -> None:
+
+        # drop the least recently used entries once the table grows past the bound
+        (count, ) = self.db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()
+        if count > self.max_entries:
+            self.db.execute(f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY used LIMIT ?)',
+                            (count - self.max_entries, ))
+        self.db.commit()
+
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def model_version(model: str) -> str:
+
+    # spaCy models are installed as packages named after the model
+    try:
+        return metadata.version(model)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
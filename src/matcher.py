@@ -0,0 +1,144 @@
+from heapq import heappop, heappush
+from typing import Hashable, Iterable, Iterator
+import copy
+
+import numpy as np
+
+from Anglicism import Anglicism
+
+class Matcher():
+    '''
+    Token level Aho-Corasick automaton over every morphology in the lexicon.
+    Finds single and multi word forms (ex: "Happy End") in one pass over a transcript.
+    '''
+    def __init__(self, anglicisms: Iterable[Anglicism]) -> None:
+
+        # goto[state] maps the next token to the next state, state 0 is the root
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        # pattern ids that end in each state
+        self.out: list[list[int]] = [[]]
+        # pattern id -> (anglicism, form, number of tokens, position of the anglicism in the lexicon)
+        self.patterns: list[tuple[Anglicism, str, int, int]] = []
+        self.max_length = 1
+        # set on copies made by with_vocab
+        self.known: np.ndarray|None = None
+
+        for pos, ang in enumerate(anglicisms):
+            if not isinstance(ang, Anglicism):
+                print(f'{ang} wrong type')
+            # ignore small ones (likely to be garbage)
+            if len(ang.ang) < 3:
+                continue
+
+            # a form listed twice for the same anglicism only needs one entry.
+            # longer forms get the lower pattern ids so they win when an anglicism matches twice at the same offset
+            forms = [(form, form.split()) for form in dict.fromkeys(ang.morphologies)]
+            for form, tokens in sorted(forms, key=lambda f: -len(f[1])):
+                if tokens:
+                    self._add(ang, form, tokens, pos)
+
+        self._link()
+
+
+    def _add(self, ang: Anglicism, form: str, tokens: list[str], pos: int) -> None:
+
+        state = 0
+        for token in tokens:
+            if token not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][token] = len(self.goto) - 1
+            state = self.goto[state][token]
+
+        self.out[state].append(len(self.patterns))
+        self.patterns.append((ang, form, len(tokens), pos))
+        self.max_length = max(self.max_length, len(tokens))
+
+
+    def _link(self) -> None:
+
+        # breadth first so every failure target is finished before it is used
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for token, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(token, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                # a state also ends every pattern its failure state ends
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+                queue.append(child)
+
+
+    def with_vocab(self, vocab: dict[str, int]) -> 'Matcher':
+
+        # copy of this automaton that reads token ids of the given vocabulary (token -> id) instead of strings
+        out = copy.copy(self)
+        out.goto = [{vocab[t]: state for t, state in g.items() if t in vocab} for g in self.goto]
+        # ids of the tokens that appear in any form
+        out.known = np.zeros(len(vocab), dtype=bool)
+        for g in out.goto:
+            out.known[list(g)] = True
+        return out
+
+
+    def iter_occurrences(self, transcript: Iterable[str]) -> Iterator[tuple[Anglicism, str, int]]:
+        # yields (anglicism, matched form, token offset) for every hit, sorted by offset.
+        # anglicisms found at the same offset come out in lexicon order
+        return self._scan(enumerate(transcript))
+
+
+    def iter_encoded(self, ids: np.ndarray) -> Iterator[tuple[Anglicism, str, int]]:
+
+        # same as iter_occurrences over the token ids of a matcher made by with_vocab.
+        # a token that is in no form always sends the automaton back to the root,
+        # so only the positions of known tokens need to be visited
+        assert self.known is not None
+        positions = np.flatnonzero(self.known[ids])
+        return self._scan(zip(positions.tolist(), ids[positions].tolist()))
+
+
+    def _scan(self, tokens: Iterable[tuple[int, Hashable]]) -> Iterator[tuple[Anglicism, str, int]]:
+
+        goto, fail, out, patterns = self.goto, self.fail, self.out, self.patterns
+
+        # matches are found at their last token, so they are held back until no
+        # longer match could still start before them. this is at most max_length tokens of hits
+        pending: list[tuple[int, int, int]] = []
+        horizon = self.max_length - 1
+        last = None
+        state = 0
+        previous = -1
+
+        def release(limit: int) -> Iterator[tuple[Anglicism, str, int]]:
+            nonlocal last
+            while pending and pending[0][0] <= limit:
+                start, pos, pattern = heappop(pending)
+                # only the longest form of an anglicism counts at a given offset
+                if (start, pos) != last:
+                    last = (start, pos)
+                    ang, form, _, _ = patterns[pattern]
+                    yield ang, form, start
+
+        for i, token in tokens:
+            # skipped positions held tokens that are in no form
+            if i != previous + 1:
+                state = 0
+            previous = i
+
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+
+            for pattern in out[state]:
+                _, _, length, pos = patterns[pattern]
+                heappush(pending, (i - length + 1, pos, pattern))
+
+            if pending:
+                yield from release(i - horizon)
+
+        yield from release(previous)
@@ -0,0 +1,124 @@
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Callable
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+PROFILE_DIR = 'output/profile/'
+# functions and allocation sites listed in a report
+PROFILE_TOP = 25
+
+class Profiler():
+    '''
+    Wall and cpu time spent in each stage of a run, plus named counters (videos, tokens, hits, ...).
+    Does nothing until enabled, so the hooks can stay in the hot path.
+    '''
+    def __init__(self) -> None:
+        self.enabled = False
+        # stage -> [wall seconds, cpu seconds, calls]
+        self.stages: dict[str, list[float]] = {}
+        self.counters: dict[str, int] = {}
+
+
+    @contextmanager
+    def timed(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+            totals[2] += 1
+
+
+    def stage(self, name: str):
+        return self.timed(name) if self.enabled else nullcontext()
+
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def take(self) -> dict:
+        # everything recorded since the last take, used to send a worker's numbers back to the main process
+        out = {'stages': self.stages, 'counters': self.counters}
+        self.stages, self.counters = {}, {}
+        return out
+
+
+    def merge(self, stats: dict) -> None:
+        for name, (wall, cpu, calls) in stats.get('stages', {}).items():
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += wall
+            totals[1] += cpu
+            totals[2] += calls
+        for name, n in stats.get('counters', {}).items():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def report(self) -> dict:
+        return {
+            'stages': {name: {'wall': wall, 'cpu': cpu, 'calls': calls} for name, (wall, cpu, calls) in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+# one per process, worker processes send theirs back with each chunk of results
+PROFILER = Profiler()
+
+def python_profile(profile: cProfile.Profile, path: str) -> list[dict]:
+
+    # the functions with the most time spent in them and their callees, the full profile is saved next to the report
+    profile.dump_stats(path)
+    stats = pstats.Stats(profile).stats # type: ignore[attr-defined]
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+    return [{'function': f'{file}:{line}({name})', 'calls': calls, 'own': own, 'cumulative': cumulative}
+            for (file, line, name), (_, calls, own, cumulative, _) in top]
+
+
+def memory_profile() -> dict:
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]
+    return {'current': current, 'peak': peak,
+            'top': [{'line': str(stat.traceback), 'size': stat.size, 'count': stat.count} for stat in top]}
+
+
+def run_profiled(name: str, fn: Callable[[], object], python: bool = False, memory: bool = False) -> str:
+
+    # runs fn with the profiler on and writes a json report to output/profile/, returns its path.
+    # cProfile and tracemalloc only see the main process, stage times include the work of every process
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{name}-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+
+    PROFILER.enabled = True
+    if memory:
+        tracemalloc.start()
+    profile = cProfile.Profile() if python else None
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profile is not None:
+        profile.enable()
+    try:
+        fn()
+    finally:
+        if profile is not None:
+            profile.disable()
+        report = {'command': name, 'created': datetime.now().isoformat(timespec='seconds'),
+                  'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu, **PROFILER.report()}
+        if profile is not None:
+            report['python'] = python_profile(profile, path + '.prof')
+        if memory:
+            report['memory'] = memory_profile()
+            tracemalloc.stop()
+        PROFILER.enabled = False
+
+        with open(path + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Profile written to file: {path}.json')
+    return path + '.json'
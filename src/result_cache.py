@@ -0,0 +1,155 @@
+from collections import Counter
+from pathlib import Path
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from Anglicism import Anglicism
+from corpus import EncodedChannel
+from lexicon import Lexicon
+
+RESULT_CACHE_PATH = 'output/cache/results.sqlite'
+# old lexicon versions kept around to work out what an edit changed
+MAX_LEXICONS = 10
+# results written between commits, an interrupted run keeps everything up to the last commit
+COMMIT_EVERY = 256
+
+class ResultCache():
+    '''
+    Per video analysis results (counts and entropies), keyed by a hash of the transcript.
+    Each result remembers the lexicon it was computed with. After the lexicon changes a result is still used
+    if the video contains no token of a form that was added, removed or changed.
+    '''
+    def __init__(self, lexicon: Lexicon, path: str = RESULT_CACHE_PATH) -> None:
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS results (
+                video TEXT, occurrences INTEGER, lexicon TEXT, found TEXT, entropies TEXT,
+                PRIMARY KEY (video, occurrences)
+            );
+            CREATE TABLE IF NOT EXISTS lexicons (
+                fingerprint TEXT PRIMARY KEY, entries TEXT, used REAL
+            );
+        ''')
+
+        self.lexicon = lexicon
+        # counted rather than a set, so adding or removing a duplicate entry is a change too
+        self.entries = Counter(lexicon.entries())
+        self.fingerprint = lexicon.fingerprint()
+        self.db.execute('INSERT OR REPLACE INTO lexicons VALUES (?, ?, ?)',
+                        (self.fingerprint, json.dumps(sorted(self.entries.elements()), ensure_ascii=False), time.time()))
+        self.db.execute('DELETE FROM lexicons WHERE fingerprint NOT IN (SELECT fingerprint FROM lexicons ORDER BY used DESC LIMIT ?)',
+                        (MAX_LEXICONS, ))
+        self.db.commit()
+
+        # (word, part of speech) -> anglicism of the current lexicon
+        self.anglicisms: dict[tuple[str, str], Anglicism] = {}
+        for a in lexicon:
+            self.anglicisms.setdefault((a.ang, a.pos), a)
+        # old lexicon fingerprint -> tokens of every form that differs from the current lexicon, None if unknown
+        self.changes: dict[str, set[str]|None] = {}
+        # the same tokens as ids of one channel's vocabulary
+        self.channel_changes: dict[tuple[Path, str], np.ndarray] = {}
+        self.channel_vocab: tuple[Path, dict[str, int]]|None = None
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.uncommitted = 0
+
+
+    def changed_tokens(self, fingerprint: str) -> set[str]|None:
+
+        if fingerprint not in self.changes:
+            row = self.db.execute('SELECT entries FROM lexicons WHERE fingerprint = ?', (fingerprint, )).fetchone()
+            if row is None:
+                self.changes[fingerprint] = None
+            else:
+                old = Counter((ang, pos, tuple(forms)) for ang, pos, forms in json.loads(row[0]))
+                # entries whose count differs between the two lexicons, a multi word form is affected by any of its tokens
+                changed = (old - self.entries) + (self.entries - old)
+                self.changes[fingerprint] = {token for _, _, forms in changed
+                                             for form in forms for token in form.split()}
+        return self.changes[fingerprint]
+
+
+    def changed_ids(self, channel: EncodedChannel, fingerprint: str) -> np.ndarray|None:
+
+        tokens = self.changed_tokens(fingerprint)
+        if tokens is None:
+            return None
+        key = (channel.directory, fingerprint)
+        if key not in self.channel_changes:
+            if self.channel_vocab is None or self.channel_vocab[0] != channel.directory:
+                self.channel_vocab = (channel.directory, {t: i for i, t in enumerate(channel.vocab)})
+            vocab = self.channel_vocab[1]
+            self.channel_changes[key] = np.asarray([vocab[t] for t in tokens if t in vocab], dtype=np.int32)
+        return self.channel_changes[key]
+
+
+    def lookup(self, channel: EncodedChannel, start: int, stop: int, all_occurrences: bool) -> list[tuple[dict, list]|None]:
+
+        # cached (counts, entropies) for videos start to stop of the channel, None where they need analyzing
+        out = []
+        for i in range(start, stop):
+            row = self.db.execute('SELECT lexicon, found, entropies FROM results WHERE video = ? AND occurrences = ?',
+                                  (channel.hashes[i], int(all_occurrences))).fetchone()
+            if row is None:
+                self.misses += 1
+                out.append(None)
+                continue
+
+            fingerprint, found_angs, entropies = row
+            if fingerprint != self.fingerprint:
+                changed = self.changed_ids(channel, fingerprint)
+                # the video holds a token of an edited form, or the old lexicon is gone
+                if changed is None or np.isin(channel.video(i), changed).any():
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self.revalidate(channel.hashes[i], all_occurrences)
+                self.revalidated += 1
+
+            self.hits += 1
+            out.append((json.loads(found_angs), self.restore(json.loads(entropies))))
+        return out
+
+
+    def restore(self, entropies: list) -> list[tuple[Anglicism, float]]:
+        return [(self.anglicisms[(ang, pos)], e) for ang, pos, e in entropies]
+
+
+    def put(self, video: str, all_occurrences: bool, found_angs: dict, entropies: list[tuple[Anglicism, float]]) -> None:
+        self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                        (video, int(all_occurrences), self.fingerprint, json.dumps(found_angs, ensure_ascii=False),
+                         json.dumps([(a.ang, a.pos, e) for a, e in entropies], ensure_ascii=False)))
+        self.written()
+
+
+    def revalidate(self, video: str, all_occurrences: bool) -> None:
+        # the result is still correct for the current lexicon
+        self.db.execute('UPDATE results SET lexicon = ? WHERE video = ? AND occurrences = ?',
+                        (self.fingerprint, video, int(all_occurrences)))
+        self.written()
+
+
+    def written(self) -> None:
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.db.commit()
+            self.uncommitted = 0
+
+
+    def report(self) -> str:
+        return (f'Result cache: {self.hits} hits ({self.revalidated} kept after lexicon changes), '
+                f'{self.misses} misses.')
+
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,129 @@
+from typing import Callable, TypeVar
+import json
+import random
+import socket
+import threading
+import time
+import xml.etree.ElementTree
+
+from youtube_transcript_api import _errors as YouTubeTranscriptErrors
+
+import googleapiclient.errors
+
+T = TypeVar('T')
+
+# error classes
+TRANSIENT = 'transient'
+QUOTA = 'quota'
+AUTH = 'auth'
+FATAL = 'fatal'
+
+# reasons the YouTube Data API gives for running out of quota versus being throttled for a moment
+QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+THROTTLE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class RateLimiter():
+    '''
+    Token bucket, allows rate calls per second on average and bursts of up to burst calls. Safe to share between threads.
+    '''
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError(f'rate must be more than 0 calls per second, got {rate}')
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def http_reasons(e: googleapiclient.errors.HttpError) -> set[str]:
+    try:
+        content = json.loads(e.content)
+        return {err.get('reason') for err in content['error'].get('errors', [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+def classify(e: Exception) -> str:
+
+    if isinstance(e, googleapiclient.errors.HttpError):
+        status = int(e.resp.status)
+        reasons = http_reasons(e)
+        if reasons & QUOTA_REASONS:
+            return QUOTA
+        if reasons & THROTTLE_REASONS or status in TRANSIENT_STATUSES:
+            return TRANSIENT
+        if status in (401, 403):
+            return AUTH
+        return FATAL
+
+    # https://github.com/jdepoix/youtube-transcript-api/issues/320, an intermittent bad response
+    if isinstance(e, xml.etree.ElementTree.ParseError):
+        return TRANSIENT
+    if isinstance(e, (YouTubeTranscriptErrors.TooManyRequests, YouTubeTranscriptErrors.YouTubeRequestFailed)):
+        return TRANSIENT
+    if isinstance(e, (ConnectionError, TimeoutError, socket.timeout)):
+        return TRANSIENT
+
+    return FATAL
+
+
+class Retry():
+    '''
+    Calls a function, retrying transient errors with exponential backoff and full jitter.
+    Quota, auth and other errors are raised straight away. The retry budget is shared by every call made through
+    this object, so a wide outage gives up instead of retrying each call to the limit. Each successful call earns
+    back refill of a retry, so the budget only runs dry while most calls are failing.
+    '''
+    def __init__(self, limiter: RateLimiter|None = None, attempts: int = 5, base: float = 1.0, cap: float = 60.0,
+                 budget: int = 100, refill: float = 0.1) -> None:
+        self.limiter = limiter
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.limit = budget
+        self.budget = float(budget)
+        self.refill = refill
+        self.lock = threading.Lock()
+
+    def spend(self) -> bool:
+        with self.lock:
+            if self.budget < 1:
+                return False
+            self.budget -= 1
+            return True
+
+    def earn(self) -> None:
+        with self.lock:
+            self.budget = min(self.limit, self.budget + self.refill)
+
+    def call(self, fn: Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                attempt += 1
+                if classify(e) != TRANSIENT or attempt >= self.attempts or not self.spend():
+                    raise
+                delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+                print(f'{type(e).__name__}: {e}. retrying in {delay:.1f}s...')
+                time.sleep(delay)
+                continue
+            self.earn()
+            return result
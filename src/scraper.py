@@ -1,8 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import argparse
 import json
 import os
 import pickle
-import time 
+import threading
 import xml
 import traceback
 
@@ -12,15 +14,107 @@ import google_auth_oauthlib.flow
 import googleapiclient.discovery
 import googleapiclient.errors
 
+from corpus import SYNC_EVERY, ChannelWriter, iter_channel
+from jobs import DONE, FAILED, STOPPED, JobQueue
+from retry import QUOTA as OUT_OF_QUOTA, TRANSIENT, RateLimiter, Retry, classify
+
+CATEGORY_CACHE_PATH = 'output/cache/categories.json'
+
+# requests per second allowed to the YouTube Data API and to the transcript endpoints
+API_LIMITER = RateLimiter(rate=10, burst=10)
+TRANSCRIPT_LIMITER = RateLimiter(rate=5, burst=5)
+API_RETRY = Retry(API_LIMITER)
+TRANSCRIPT_RETRY = Retry(TRANSCRIPT_LIMITER)
+
+def positive_rate(value: str) -> float:
+    # argparse type for the rate limits, a rate of 0 would never allow a call
+    out = float(value)
+    if out <= 0:
+        raise argparse.ArgumentTypeError(f'must be more than 0 requests per second, got {value}')
+    return out
+
+
+class QuotaCounter():
+    '''
+    Counts the YouTube Data API quota units used in this run, per endpoint.
+    '''
+    # every list call used by the scraper costs one unit
+    COSTS = {'channels.list': 1, 'playlistItems.list': 1, 'videos.list': 1, 'videoCategories.list': 1}
+
+    def __init__(self) -> None:
+        self.units: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def execute(self, request, endpoint: str):
+        # every attempt is charged, including the ones that get retried
+        def attempt():
+            with self.lock:
+                self.units[endpoint] = self.units.get(endpoint, 0) + self.COSTS.get(endpoint, 1)
+            return request.execute()
+        return API_RETRY.call(attempt)
+
+    def report(self) -> str:
+        lines = [f'  {endpoint}: {units}' for endpoint, units in sorted(self.units.items())]
+        return '\n'.join([f'Quota used this run: {sum(self.units.values())} units'] + lines)
+
+QUOTA = QuotaCounter()
+
+# builds a YouTube Data API client, set once the user has logged in
+CLIENT_FACTORY = None
+CLIENTS = threading.local()
+
+def youtube():
+    if not hasattr(CLIENTS, 'client'):
+        CLIENTS.client = CLIENT_FACTORY()
+    return CLIENTS.client
+
+# category id -> category name, shared by every scraper and saved between runs
+CATEGORIES: dict[str, str] = {}
+CATEGORIES_LOCK = threading.Lock()
+
+def resolve_categories(categoryIds: list[str]) -> dict[str, str]:
+
+    with CATEGORIES_LOCK:
+        if not CATEGORIES and os.path.exists(CATEGORY_CACHE_PATH):
+            with open(CATEGORY_CACHE_PATH, 'r') as f:
+                CATEGORIES.update(json.load(f))
+
+        # all unknown ids are resolved in a single request
+        missing = sorted(set(categoryIds) - CATEGORIES.keys())
+        if missing:
+            request = youtube().videoCategories().list(
+                part="snippet",
+                id=','.join(missing)
+            )
+            response = QUOTA.execute(request, 'videoCategories.list')
+            CATEGORIES.update({item['id']: item['snippet']['title'] for item in response['items']})
+
+            os.makedirs(os.path.dirname(CATEGORY_CACHE_PATH), exist_ok=True)
+            with open(CATEGORY_CACHE_PATH, 'w') as f:
+                json.dump(CATEGORIES, f, ensure_ascii=False)
+
+        return dict(CATEGORIES)
+
+
 class ChannelScraper():
     '''
     Iterator class to scrape all videos from a given channel
     '''
-    def __init__(self, channelId, pageToken=None):
+    # class level defaults so scrapers pickled by older versions still load
+    concurrency = 8
+    transcriptApi = YouTubeTranscriptApi
+
+    def __init__(self, channelId, pageToken=None, concurrency=None, transcriptApi=None):
 
         self.NUM_RESULTS = 50
         self.channelId = channelId
         self.done = False
+        # maximum number of transcripts downloaded at the same time
+        if concurrency is not None:
+            self.concurrency = concurrency
+        # anything with the list_transcripts interface of YouTubeTranscriptApi, ex: a local fake for testing
+        if transcriptApi is not None:
+            self.transcriptApi = transcriptApi
 
         if pageToken is not None:
             self.pageToken = pageToken
@@ -28,16 +122,12 @@ class ChannelScraper():
             self.pageToken = None
 
     def __iter__(self):
-        request = Youtube.channels().list(
+        request = youtube().channels().list(
             part="contentDetails",
             id=self.channelId
         )
-        # if we cannot find the playlist then we cannot make the iterator
-        try:
-            response = request.execute()
-        except Exception as e:
-            self.done = True
-            return iter([])
+        # errors are left to the caller, which decides whether the channel is stopped or failed
+        response = QUOTA.execute(request, 'channels.list')
 
         # get the uoloads playlist ID for given channel
         self.uploadsId = response['items'][0]['contentDetails']['relatedPlaylists']['uploads'] 
@@ -49,20 +139,14 @@ class ChannelScraper():
             raise StopIteration
 
         # get the videos from channel's uploads playlsit 
-        request = Youtube.playlistItems().list(
+        request = youtube().playlistItems().list(
             part="contentDetails",
             playlistId=self.uploadsId,
             pageToken=self.pageToken,
             maxResults=self.NUM_RESULTS
         )
 
-        # assume all errors are 401s and end iteration
-        # TODO: don't assume that 
-        try:
-            response = request.execute()
-        except Exception as e:
-            print(f'Error getting playlist items: {e}')
-            raise StopIteration
+        response = QUOTA.execute(request, 'playlistItems.list')
 
         videoIds = [item['contentDetails']['videoId'] for item in response['items']]
 
@@ -72,83 +156,40 @@ class ChannelScraper():
         else:
             nextPageToken = None
 
-        transcripts = []
-        for id in videoIds[:]:
-            try:
-                # get all available transcripts
-                l = YouTubeTranscriptApi.list_transcripts(id)
-            except YouTubeTranscriptErrors.TranscriptsDisabled:
-                print(f'Transcripts are disabled for video: {id}. skipping...');
-                videoIds.remove(id)
-                continue
-            try:
-                # check if there is german
-                response = l.find_transcript(['de']).fetch()
-            except YouTubeTranscriptErrors.NoTranscriptFound:
-                print(f'No German transcript for video: {id}. skipping...');
-                videoIds.remove(id)
-                continue
-            # https://github.com/jdepoix/youtube-transcript-api/issues/320
-            # there seems to be no solution for this intermittent issue yet
-            # for now wait 10 seconds and then retry the whole process.
-            # 10 seconds is probably overkill but it works.
-            except xml.etree.ElementTree.ParseError:
-                print('weird xml error happened. retrying...')
-                time.sleep(10)
-                try:
-                    l = YouTubeTranscriptApi.list_transcripts(id)
-                except YouTubeTranscriptErrors.TranscriptsDisabled:
-                    print(f'Transcripts are disabled for video: {id}. skipping...');
-                    videoIds.remove(id)
-                    continue
-                try:
-                    response = l.find_transcript(['de']).fetch()
-                except YouTubeTranscriptErrors.NoTranscriptFound:
-                    print(f'No German transcript for video: {id}. skipping...');
-                    videoIds.remove(id)
-                    continue
-                except xml.etree.ElementTree.ParseError:
-                    print('retry failed. skipping...')
-
-
-            # add the transcript to the list 
-            print(f'Successfully downloaded transcript for video: {id}')
-            transcript = ' '.join([i['text'] for i in response])
-            transcripts.append(transcript)
+        # download the transcripts concurrently, map keeps them in the same order as videoIds
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            fetched = list(pool.map(self.fetch_transcript, videoIds))
+        transcripts = {id: t for id, t in zip(videoIds, fetched) if t is not None}
+        videoIds = [id for id in videoIds if id in transcripts]
+
+        if not videoIds:
+            self.pageToken = nextPageToken
+            if not nextPageToken:
+                self.done = True
+            return []
 
         # get the video metadata (category and title)
-        request = Youtube.videos().list(
+        request = youtube().videos().list(
             part="snippet",
             id=videoIds,
             maxResults=self.NUM_RESULTS
         )
-        try:
-            response = request.execute()
-        except Exception as e:
-            print(f'Error getting video data: {e}')
-            raise StopIteration
+        response = QUOTA.execute(request, 'videos.list')
 
-        titles = [item['snippet']['title'] for item in response['items']]
-        categoryIds = [item['snippet']['categoryId'] for item in response['items']]
+        # the metadata is matched to the transcripts by video id, not by position
+        items = {item['id']: item for item in response['items']}
+        videoIds = [id for id in videoIds if id in items]
+        titles = [items[id]['snippet']['title'] for id in videoIds]
+        categoryIds = [items[id]['snippet']['categoryId'] for id in videoIds]
 
-        # get the actual names from the category ids 
-        categories = []
-        for id in categoryIds:
-            request = Youtube.videoCategories().list(
-                part="snippet",
-                id=id
-            )
+        # get the actual names from the category ids, one request at most for the whole page
+        names = resolve_categories(categoryIds)
+        categories = [names.get(id) for id in categoryIds]
 
-            try:
-                response = request.execute()
-                categories.extend([item['snippet']['title'] for item in response['items']])
-            except Exception as e:
-                print(f'Error getting video category data: {e}')
-                raise StopIteration
-    
         videoData = []
         # create dictionaries for each video with the title, category and transcript
-        for transcript, category, title in zip(transcripts, categories, titles):
+        for id, category, title in zip(videoIds, categories, titles):
+            transcript = transcripts[id]
             videoData.append({'title': title, 'category': category, 'transcript': transcript})
 
         # update the page token 
@@ -161,56 +202,124 @@ class ChannelScraper():
         return videoData
 
 
-def save_progress(out: dict, failed: ChannelScraper|None):
-
-    print('saving progress...')
-    with open(f'output/{out["id"]}.json', 'w') as f:
-        json.dump(out, f, ensure_ascii=False)
+    def fetch_transcript(self, id: str) -> str|None:
 
-    if ChannelScraper is not None:
-        with open('output/progress.pkl', 'wb') as f:
-            pickle.dump(failed, f)
+        # returns the german transcript of a video, or None if it has none
+        try:
+            # get all available transcripts and check if there is german.
+            # intermittent failures (ex: https://github.com/jdepoix/youtube-transcript-api/issues/320)
+            # are retried with backoff
+            response = TRANSCRIPT_RETRY.call(lambda: self.transcriptApi.list_transcripts(id).find_transcript(['de']).fetch())
+        except YouTubeTranscriptErrors.TranscriptsDisabled:
+            print(f'Transcripts are disabled for video: {id}. skipping...');
+            return None
+        except YouTubeTranscriptErrors.NoTranscriptFound:
+            print(f'No German transcript for video: {id}. skipping...');
+            return None
+        except xml.etree.ElementTree.ParseError:
+            print('retry failed. skipping...')
+            return None
+        except YouTubeTranscriptErrors.CouldNotRetrieveTranscript as e:
+            # rate limits and failed requests that outlasted the retries fail the page, so it is scraped again later
+            if classify(e) == TRANSIENT:
+                raise
+            # anything else is about this one video (ex: unavailable, private, no transcript at all)
+            print(f'Could not get a transcript for video: {id} ({type(e).__name__}). skipping...')
+            return None
+
+        # add the transcript to the list 
+        print(f'Successfully downloaded transcript for video: {id}')
+        return ' '.join([i['text'] for i in response])
+
+
+def load_output(channelId: str) -> dict:
+
+    # reads both the append only .jsonl files and the .json files written by older versions
+    for path in [Path(f'output/{channelId}.jsonl'), Path(f'output/{channelId}.json')]:
+        if path.exists():
+            return {'id': channelId, 'transcripts': list(iter_channel(path))}
+    print(f'Warning: output file not found for partially scraped channel "{channelId}". Possible loss of data.')
+    return {'id': channelId, 'transcripts': []}
 
 
 def load_progress() -> tuple[dict, ChannelScraper]|None:
+    # progress.pkl is how older versions saved a partially scraped channel, it is only read to move it into the job queue
     if os.path.exists('output/progress.pkl'):
         with open('output/progress.pkl', 'rb') as scraper_file:
             s = pickle.load(scraper_file)
             if s is None:
                 return None
-            if os.path.exists(f'output/{s.channelId}.json'):
-                with open(f'output/{s.channelId}.json', 'r') as output_file:
-                    out = json.load(output_file)
-            else:
-                print(f'Warning: output file not found for partially scraped channel "{s.channelId}". Possible loss of data.')
-                out = {'id': s.channelId, 'transcripts': []}
-            return (out, s)
+            return (load_output(s.channelId), s)
     return None
 
-def scrape_channel(s: ChannelScraper, out: dict|None = None) -> bool:
 
-    if out is None:
-        out = {'id': s.channelId, 'transcripts': []}
+def open_output(s: ChannelScraper, sync_every: int = SYNC_EVERY) -> ChannelWriter:
+
+    legacy = Path(f'output/{s.channelId}.json')
+    if s.pageToken is not None and not Path(f'output/{s.channelId}.jsonl').exists() and legacy.exists():
+        # carry the videos of a channel started by an older version over as one committed page
+        writer = ChannelWriter(s.channelId, resume=False, sync_every=sync_every)
+        writer.write_page(load_output(s.channelId)['transcripts'], s.pageToken)
+        legacy.unlink()
+        return writer
+
+    writer = ChannelWriter(s.channelId, sync_every=sync_every)
+    # the file only holds committed pages, so its page token wins over the queue's
+    if writer.pages > 0:
+        s.pageToken = writer.next_token
+    return writer
+
+
+def scrape_channel(s: ChannelScraper, queue: JobQueue, stop: threading.Event, sync_every: int = SYNC_EVERY) -> str:
+
+    writer = open_output(s, sync_every)
+    # the last page was committed but the run stopped before the channel was marked as done
+    if writer.pages > 0 and writer.next_token is None:
+        writer.close()
+        print(f'Finished scraping channel: {s.channelId}')
+        return DONE
 
     try:
         for v in s: 
-            out['transcripts'].extend(v)
-    except:
+            # the page is committed to the file before the queue moves on to the next page token
+            writer.write_page(v, s.pageToken)
+            queue.checkpoint(s.channelId, s.pageToken)
+            # another channel ran out of quota
+            if stop.is_set() and not s.done:
+                return STOPPED
+    except Exception as e:
+        # running out of quota stops every channel until the next run, anything else only fails this one
+        if classify(e) == OUT_OF_QUOTA:
+            print(f'Reached quota limit while scraping channel: {s.channelId}.')
+            stop.set()
+            return STOPPED
         print(f'Error occurred while scraping channel: {s.channelId}')
         traceback.print_exc()
-        save_progress(out, s)
-        return False
-    else:
-        if not s.done:
-            print(f'Reached quota limit while scraping channel: {s.channelId}.')
-            save_progress(out, s)
-        else:
-            print(f'Finished scraping channel: {s.channelId}')
-            save_progress(out, None)
+        return FAILED
+    finally:
+        writer.close()
+
+    # the loop only ends once the last page of uploads has been written
+    print(f'Finished scraping channel: {s.channelId}')
+    return DONE
+
+
+def scrape_jobs(queue: JobQueue, stop: threading.Event, concurrency: int, sync_every: int = SYNC_EVERY) -> None:
 
-        return s.done
+    # takes channels from the queue until it is empty or the quota runs out
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            return
+        (channelId, pageToken) = job
+        status = scrape_channel(ChannelScraper(channelId, pageToken, concurrency), queue, stop, sync_every)
+        queue.finish(channelId, status)
+        # the quota is shared by every channel, so stop them all
+        if status == STOPPED:
+            stop.set()
 
-def main(file: str) -> None:
+
+def main(file: str, concurrency: int = ChannelScraper.concurrency, workers: int = 1, sync_every: int = SYNC_EVERY) -> None:
 
     # make sure inputted file exists
     if not os.path.exists(file):
@@ -222,32 +331,50 @@ def main(file: str) -> None:
     with open(file, 'r') as f:
         channels = [line.strip() for line in f]
 
-    # load progress if there is any
-    start_index = 0
+    os.makedirs('output', exist_ok=True)
+    queue = JobQueue()
+
+    # move a channel left partially scraped by an older version into the queue
     loaded = load_progress()
-    # if there is a partially finished channel, we need to scrape it
     if loaded is not None:
-        (out, last) = loaded
-        try:
-            # save the index of the channel after the partially completed one 
-            start_index = channels.index(last.channelId)+1
-        except ValueError:
-            print(f'Warning: saved channel id "{last.channelId}" not found in file "{file}". will continue from the beginning of channels file after scraping channel "{last.channelId}".')
+        (_, last) = loaded
+        queue.add([last.channelId])
+        queue.checkpoint(last.channelId, last.pageToken)
+    if os.path.exists('output/progress.pkl'):
+        os.replace('output/progress.pkl', 'output/progress.pkl.old')
+
+    # channels finished in earlier runs are skipped, unfinished ones resume from their last page
+    queue.add(channels)
+    queue.recover()
 
-        if not scrape_channel(last, out):
-            start_index = len(channels)
+    stop = threading.Event()
+    threads = [threading.Thread(target=scrape_jobs, args=(queue, stop, concurrency, sync_every)) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
 
-    # continue scraping channels from the file 
-    for i in range(start_index, len(channels)):
-        s = ChannelScraper(channels[i])
-        if not scrape_channel(s):
-            break;
+    print(f'Channels: {queue.summary()}')
+    queue.close()
+    print(QUOTA.report())
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog='Corpus Scraper')
     parser.add_argument('channels', type=str, action='store',
                         help='file containing a list of channel ids separated by newlines')
+    parser.add_argument('--concurrency', type=int, default=ChannelScraper.concurrency,
+                        help='maximum number of transcripts downloaded at the same time')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of channels scraped at the same time')
+    parser.add_argument('--api-rate', type=positive_rate, default=API_LIMITER.rate,
+                        help='maximum YouTube Data API requests per second')
+    parser.add_argument('--transcript-rate', type=positive_rate, default=TRANSCRIPT_LIMITER.rate,
+                        help='maximum transcript downloads per second')
+    parser.add_argument('--sync-every', type=int, default=SYNC_EVERY,
+                        help='number of pages written to a channel file between fsyncs, pages since the last one are scraped again after a crash')
     args = parser.parse_args()
+    API_LIMITER.rate = args.api_rate
+    TRANSCRIPT_LIMITER.rate = args.transcript_rate
 
     scopes = ["https://www.googleapis.com/auth/youtube.readonly"]
     # Disable OAuthlib's HTTPS verification when running locally.
@@ -263,7 +390,8 @@ if __name__ == '__main__':
         client_secrets_file, scopes)
     flow.run_local_server()
     credentials = flow.credentials
-    Youtube = googleapiclient.discovery.build(
+    # the http client behind the API client is not thread safe, each thread builds its own
+    CLIENT_FACTORY = lambda: googleapiclient.discovery.build(
         api_service_name, api_version, credentials=credentials)
 
-    main(args.channels)
+    main(args.channels, args.concurrency, args.workers, args.sync_every)
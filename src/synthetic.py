@@ -0,0 +1,81 @@
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterator
+import random
+
+from corpus import ChannelWriter
+from lexicon import Lexicon
+
+# made up corpora for benchmarks, no network or spaCy model needed.
+# everything is generated from a seed so two runs with the same sizes see the same data
+
+GERMAN_SYLLABLES = ['ein', 'der', 'die', 'und', 'sch', 'ver', 'ge', 'be', 'ung', 'keit', 'lich', 'ich', 'ach', 'ter',
+                    'hei', 'wa', 'sen', 'mit', 'auf', 'zu', 'ran', 'gen', 'berg', 'stadt', 'feld', 'haus', 'ar', 'bei',
+                    'ten', 'nach', 'ig', 'isch', 'wie', 'so', 'mal', 'rot', 'kl', 'ei', 'ne', 'el']
+ENGLISH_SYLLABLES = ['com', 'pu', 'ter', 'lap', 'top', 'chat', 'flow', 'smart', 'click', 'page', 'stream', 'star',
+                     'shop', 'ping', 'team', 'work', 'board', 'fit', 'ness', 'block', 'job', 'cool', 'down', 'load',
+                     'fair', 'play', 'song', 'high', 'light', 'soft', 'ware', 'base', 'line', 'date', 'up']
+# roughly how often each part of speech shows up in the real anglicism list
+PARTS_OF_SPEECH = {'NOUN': 0.65, 'VERB': 0.15, 'ADJ': 0.15, 'ADV': 0.05}
+CATEGORIES = ['Gaming', 'Music', 'Education', 'Entertainment', 'People & Blogs', 'Science & Technology']
+
+def make_word(rng: random.Random, syllables: list[str], shortest: int = 1, longest: int = 4) -> str:
+    return ''.join(rng.choice(syllables) for _ in range(rng.randint(shortest, longest)))
+
+
+def make_vocabulary(size: int, seed: int = 0) -> list[str]:
+
+    # german like words, about a third of them capitalized like nouns
+    rng = random.Random(seed)
+    words: dict[str, None] = {}
+    while len(words) < size:
+        word = make_word(rng, GERMAN_SYLLABLES)
+        words[word.capitalize() if rng.random() < 0.3 else word] = None
+    return list(words)
+
+
+def make_lexicon(size: int, seed: int = 0, multi_word: float = 0.05) -> list[tuple[str, str]]:
+
+    # (anglicism, part of speech) pairs, ready for Anglicism.from_tagged. a few are two words (ex: "Happy End")
+    rng = random.Random(seed)
+    tags, weights = list(PARTS_OF_SPEECH), list(PARTS_OF_SPEECH.values())
+    out: dict[str, str] = {}
+    while len(out) < size:
+        word = make_word(rng, ENGLISH_SYLLABLES, 1, 3)
+        if rng.random() < multi_word:
+            word += ' ' + make_word(rng, ENGLISH_SYLLABLES, 1, 2)
+        pos = rng.choices(tags, weights)[0]
+        out.setdefault(word.capitalize() if pos == 'NOUN' else word, pos)
+    return list(out.items())
+
+
+def make_videos(count: int, length: int, lexicon: Lexicon, vocabulary: list[str], rate: float = 0.01,
+                seed: int = 0) -> Iterator[dict]:
+
+    # videos shaped like the scraper's output. words follow a zipf distribution over the vocabulary
+    # and about rate of the tokens are replaced by a random form of a random anglicism
+    rng = random.Random(seed)
+    cumulative = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for n in range(count):
+        tokens = rng.choices(vocabulary, cum_weights=cumulative, k=length)
+        for position in rng.sample(range(length), int(length * rate)):
+            tokens[position] = rng.choice(lexicon.morphologies(rng.randrange(len(lexicon))))
+        yield {'title': f'Video {n}', 'category': rng.choice(CATEGORIES), 'transcript': ' '.join(tokens)}
+
+
+def write_channels(directory: str, channels: int, videos: Iterator[dict], page_size: int = 50) -> list[Path]:
+
+    # spreads the videos over channel files the way the scraper writes them, one page at a time
+    writers = [ChannelWriter(f'channel{n}', directory, resume=False) for n in range(channels)]
+    pages: list[list[dict]] = [[] for _ in writers]
+    for n, video in enumerate(videos):
+        page = pages[n % channels]
+        page.append(video)
+        if len(page) == page_size:
+            writers[n % channels].write_page(page, 'next')
+            page.clear()
+
+    for writer, page in zip(writers, pages):
+        writer.write_page(page, None)
+        writer.close()
+    return [writer.path for writer in writers]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules in src/ import each other by bare name, as when running the scripts
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
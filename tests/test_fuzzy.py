@@ -0,0 +1,42 @@
+from Anglicism import Anglicism
+from analysis import find_fuzzy
+from fuzzy import FuzzyIndex, edit_distance
+from lexicon import Lexicon
+
+
+def index(*words: tuple[str, str]) -> FuzzyIndex:
+    return FuzzyIndex(Lexicon.from_anglicisms(Anglicism.from_tagged(list(words))))
+
+
+def test_misspellings_are_found():
+    found = index(('Computer', 'NOUN')).lookup('Compuetr')
+    assert [(ang.ang, form, distance) for ang, form, distance in found] == [('Computer', 'Computer', 1)]
+
+
+def test_case_only_differences_are_not_misspellings():
+    fuzzy = index(('Computer', 'NOUN'), ('streamen', 'VERB'))
+    assert fuzzy.lookup('COMPUTER') == []
+    assert fuzzy.lookup('computer') == []
+    assert fuzzy.lookup('Streamen') == []
+
+
+def test_exact_and_short_tokens_are_left_out():
+    fuzzy = index(('Computer', 'NOUN'), ('Chat', 'NOUN'))
+    assert fuzzy.lookup('Computer') == []
+    assert fuzzy.lookup('Chta') == []
+
+
+def test_edit_distance_counts_swaps_as_one_edit():
+    assert edit_distance('computer', 'cmoputer', 2) == 1
+    assert edit_distance('computer', 'laptop', 2) == 3
+
+
+def test_one_match_per_anglicism_when_several_forms_are_as_close():
+    # Laptopx is one edit from Laptop, Laptops and Laptopn
+    found = index(('Laptop', 'NOUN'), ('Laptop', 'ADJ')).lookup('Laptopx')
+    assert [(ang.ang, distance) for ang, _, distance in found] == [('Laptop', 1)]
+
+
+def test_close_matches_are_counted_once_per_occurrence():
+    video = {'title': 'x', 'category': 'Gaming', 'transcript': 'ein Laptopx und noch ein Laptopx und ein Laptop'}
+    assert find_fuzzy(video, index(('Laptop', 'NOUN'))) == {('Laptop', 'Laptopx', 1): 2}
@@ -0,0 +1,51 @@
+import sqlite3
+
+import result_cache
+from Anglicism import Anglicism
+from corpus import build_encoded
+from lexicon import Lexicon
+from result_cache import ResultCache
+
+
+def lexicon(*words: tuple[str, str]) -> Lexicon:
+    return Lexicon.from_anglicisms(Anglicism.from_tagged(list(words)))
+
+
+def channel(tmp_path):
+    return build_encoded(tmp_path / 'channel.tokens', {}, [('das ist Cool'.split(), 'video', {})])
+
+
+def test_a_duplicated_entry_invalidates_results(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    c = channel(tmp_path)
+    cache = ResultCache(lexicon(('Cool', 'ADJ'), ('Chat', 'NOUN')), path)
+    cache.put('video', False, {'Cool': 1}, [])
+    cache.close()
+
+    cache = ResultCache(lexicon(('Cool', 'ADJ'), ('Chat', 'NOUN'), ('Cool', 'ADJ')), path)
+    assert cache.lookup(c, 0, 1, False) == [None]
+    cache.close()
+
+
+def test_unrelated_edits_keep_results(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    c = channel(tmp_path)
+    cache = ResultCache(lexicon(('Cool', 'ADJ'), ('Chat', 'NOUN')), path)
+    cache.put('video', False, {'Cool': 1}, [])
+    cache.close()
+
+    cache = ResultCache(lexicon(('Cool', 'ADJ'), ('Chat', 'NOUN'), ('Chat', 'NOUN')), path)
+    assert cache.lookup(c, 0, 1, False) == [({'Cool': 1}, [])]
+    cache.close()
+
+
+def test_results_are_committed_before_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, 'COMMIT_EVERY', 2)
+    path = str(tmp_path / 'results.sqlite')
+    cache = ResultCache(lexicon(('Cool', 'ADJ')), path)
+    for n in range(3):
+        cache.put(f'video{n}', False, {}, [])
+    # a run that stops here keeps the committed results
+    (count, ) = sqlite3.connect(path).execute('SELECT COUNT(*) FROM results').fetchone()
+    assert count == 2
+    cache.close()
@@ -0,0 +1,49 @@
+import pytest
+
+import retry
+from retry import RateLimiter, Retry
+
+
+class Flaky():
+    '''
+    Fails with a transient error the given number of times, then succeeds.
+    '''
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+
+    def __call__(self) -> str:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('reset')
+        return 'ok'
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry.time, 'sleep', lambda _: None)
+
+
+def test_budget_refills_after_successes():
+    r = Retry(budget=2, refill=0.5)
+    assert r.call(Flaky(2)) == 'ok'
+    # the budget is spent, a transient error is raised straight away
+    with pytest.raises(ConnectionError):
+        r.call(Flaky(1))
+
+    # two successful calls earn back one retry
+    r.call(Flaky(0))
+    r.call(Flaky(0))
+    assert r.call(Flaky(1)) == 'ok'
+
+
+def test_budget_never_goes_over_its_size():
+    r = Retry(budget=1, refill=1)
+    for _ in range(10):
+        r.call(Flaky(0))
+    assert r.budget == 1
+
+
+@pytest.mark.parametrize('rate', [0, -1])
+def test_rate_limiter_rejects_rates_that_never_allow_a_call(rate):
+    with pytest.raises(ValueError):
+        RateLimiter(rate)
@@ -0,0 +1,145 @@
+import json
+import threading
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from youtube_transcript_api import _errors as YouTubeTranscriptErrors
+
+import retry
+import scraper
+from corpus import iter_channel
+from jobs import DONE, FAILED, STOPPED, JobQueue
+
+
+def http_error(status: int, reason: str) -> HttpError:
+    content = json.dumps({'error': {'errors': [{'reason': reason}]}}).encode()
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+class Request():
+    def __init__(self, response) -> None:
+        self.response = response
+
+    def execute(self):
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+class Endpoint():
+    def __init__(self, response) -> None:
+        self.response = response
+
+    def list(self, **kwargs) -> Request:
+        return Request(self.response)
+
+
+class FakeClient():
+    '''
+    The parts of the YouTube Data API client used by the scraper, answering with the given responses.
+    '''
+    def __init__(self, channels, playlist_items=None, videos=None, categories=None) -> None:
+        self.responses = {'channels': channels, 'playlistItems': playlist_items, 'videos': videos,
+                          'videoCategories': categories}
+
+    def __getattr__(self, endpoint: str):
+        # client.channels() returns the endpoint, client.channels().list(...) the request
+        return lambda: Endpoint(self.responses[endpoint])
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'output').mkdir()
+    monkeypatch.setattr(retry.time, 'sleep', lambda _: None)
+    monkeypatch.setattr(scraper, 'CATEGORIES', {})
+    q = JobQueue(str(tmp_path / 'jobs.sqlite'))
+    q.add(['channel'])
+    yield q
+    q.db.close()
+
+
+def scrape(client, queue, transcriptApi=None) -> tuple[str, threading.Event]:
+    scraper.CLIENTS.client = client
+    try:
+        stop = threading.Event()
+        s = scraper.ChannelScraper('channel', concurrency=4, transcriptApi=transcriptApi)
+        return scraper.scrape_channel(s, queue, stop), stop
+    finally:
+        del scraper.CLIENTS.client
+
+
+def test_quota_stops_the_channel_to_be_resumed(queue):
+    status, stop = scrape(FakeClient(http_error(403, 'quotaExceeded')), queue)
+    assert status == STOPPED
+    assert stop.is_set()
+
+
+def test_other_errors_fail_the_channel(queue):
+    status, stop = scrape(FakeClient(http_error(404, 'channelNotFound')), queue)
+    assert status == FAILED
+    assert not stop.is_set()
+
+
+def test_quota_on_a_later_page_does_not_finish_the_channel(queue):
+    channels = {'items': [{'contentDetails': {'relatedPlaylists': {'uploads': 'uploads'}}}]}
+    status, _ = scrape(FakeClient(channels, http_error(403, 'quotaExceeded')), queue)
+    assert status == STOPPED
+
+
+def test_done_once_the_uploads_run_out(queue):
+    channels = {'items': [{'contentDetails': {'relatedPlaylists': {'uploads': 'uploads'}}}]}
+    status, _ = scrape(FakeClient(channels, {'items': []}), queue)
+    assert status == DONE
+
+
+class Transcript():
+    def __init__(self, text) -> None:
+        self.text = text
+
+    def find_transcript(self, languages: list[str]) -> 'Transcript':
+        return self
+
+    def fetch(self) -> list[dict]:
+        return [{'text': self.text}]
+
+
+class FakeTranscriptApi():
+    '''
+    Stands in for YouTubeTranscriptApi. Videos map to their transcript, or to the error fetching it raises.
+    '''
+    videos: dict = {}
+
+    @classmethod
+    def list_transcripts(cls, id: str) -> Transcript:
+        if isinstance(cls.videos[id], Exception):
+            raise cls.videos[id]
+        return Transcript(cls.videos[id])
+
+
+def page_client(ids: list[str]) -> FakeClient:
+    channels = {'items': [{'contentDetails': {'relatedPlaylists': {'uploads': 'uploads'}}}]}
+    playlist = {'items': [{'contentDetails': {'videoId': id}} for id in ids]}
+    videos = {'items': [{'id': id, 'snippet': {'title': f'title {id}', 'categoryId': '20'}} for id in ids]}
+    return FakeClient(channels, playlist, videos, {'items': [{'id': '20', 'snippet': {'title': 'Gaming'}}]})
+
+
+def test_videos_without_a_transcript_are_skipped(queue, monkeypatch):
+    monkeypatch.setattr(FakeTranscriptApi, 'videos', {
+        'a': 'eins', 'gone': YouTubeTranscriptErrors.VideoUnavailable('gone'), 'b': 'zwei',
+        'none': YouTubeTranscriptErrors.NoTranscriptAvailable('none'), 'c': 'drei',
+    })
+    status, _ = scrape(page_client(['a', 'gone', 'b', 'none', 'c']), queue, FakeTranscriptApi)
+    assert status == DONE
+    videos = list(iter_channel(scraper.Path('output/channel.jsonl')))
+    assert [(v['title'], v['category'], v['transcript']) for v in videos] == [
+        ('title a', 'Gaming', 'eins'), ('title b', 'Gaming', 'zwei'), ('title c', 'Gaming', 'drei')]
+
+
+def test_rate_limited_transcripts_fail_the_page(queue, monkeypatch):
+    monkeypatch.setattr(FakeTranscriptApi, 'videos', {'a': 'eins', 'b': YouTubeTranscriptErrors.TooManyRequests('b')})
+    status, _ = scrape(page_client(['a', 'b']), queue, FakeTranscriptApi)
+    assert status == FAILED
+    assert list(iter_channel(scraper.Path('output/channel.jsonl'))) == []